@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the DMO report page, for benchmarking and testing downloads offline.
+
+The server mimics the parts of https://www.dmo.gov.uk/data/pdfdatareport that
+download_and_format_gilts.py relies on: a cookie banner, a report date input and
+an Excel button that posts the form and streams back an .xls attachment. The
+workbook comes from the fixtures directory, and the response latency, size and
+streaming speed can be configured.
+
+Usage:
+    python3 dmo_standin_server.py --port 8765 --latency 0.5
+    python3 download_and_format_gilts.py --base-url http://127.0.0.1:8765/data/pdfdatareport
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+DEFAULT_FIXTURE = os.path.join(FIXTURES_DIR, 'gilts_in_issue_small.xls')
+
+# Cookie set by the banner's accept button, as OneTrust does on dmo.gov.uk
+CONSENT_COOKIE = 'OptanonAlertBoxClosed'
+
+# OLE2 files are read in 512-byte sectors, so padding is rounded up to keep xlrd quiet
+SECTOR_SIZE = 512
+
+REPORT_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<title>Report {report_code} - DMO stand-in</title>
+<link rel="icon" href="/static/favicon.ico">
+</head>
+<body>
+<div id="onetrust-banner-sdk" style="{banner_style}position:fixed;bottom:0;left:0;right:0;background:#eee;padding:1em">
+  <p>We use cookies to make this site work.</p>
+  <button id="onetrust-accept-btn-handler" onclick="acceptCookies()">Accept All Cookies</button>
+</div>
+<h1>Report {report_code}</h1>
+<img src="/static/logo.png" alt="DMO">
+<form method="post" action="/data/export">
+  <input type="hidden" name="reportCode" value="{report_code}">
+  <label for="reportDate">Date</label>
+  <input type="text" id="reportDate" name="reportDate" placeholder="dd/mm/yyyy" value="{default_date}">
+  <button type="submit" name="format" value="excel" class="btn">Excel</button>
+  <button type="submit" name="format" value="pdf" class="btn">PDF</button>
+</form>
+<script>
+function acceptCookies() {{
+    const expires = new Date(Date.now() + 365 * 24 * 3600 * 1000).toUTCString();
+    document.cookie = "{consent_cookie}=" + new Date().toISOString() + "; expires=" + expires + "; path=/";
+    document.getElementById('onetrust-banner-sdk').style.display = 'none';
+}}
+</script>
+</body>
+</html>
+"""
+
+# Served instead of the workbook when StandinConfig.challenge is set
+CHALLENGE_PAGE = """<!DOCTYPE html>
+<html><head><title>Just a moment...</title></head>
+<body><p>Checking your browser before accessing the site.</p></body></html>
+"""
+
+class StandinConfig:
+    """
+    Behaviour of the stand-in server.
+
+    Args:
+        fixture (str): Workbook served by the Excel export.
+        latency (float): Seconds to wait before answering an export request.
+        page_latency (float): Seconds to wait before answering a report page request.
+        size (int, optional): Pad the workbook with zero bytes up to this many bytes.
+        chunk_size (int): Bytes written per chunk when streaming the workbook.
+        chunk_delay (float): Seconds to wait between chunks.
+        asset_size (int): Size in bytes of the image and icon the report page loads.
+        challenge (bool): Answer export requests with an HTML bot challenge page
+            instead of the workbook.
+
+    The form fields of every export request are appended to exports, so tests can
+    check what was asked for.
+    """
+
+    def __init__(self, fixture=DEFAULT_FIXTURE, latency=0.0, page_latency=0.0, size=None,
+                 chunk_size=64 * 1024, chunk_delay=0.0, asset_size=200 * 1024, challenge=False):
+        self.fixture = fixture
+        self.latency = latency
+        self.page_latency = page_latency
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.asset_size = asset_size
+        self.challenge = challenge
+        self.exports = []
+        self.workbook = self._load_workbook()
+
+    def _load_workbook(self):
+        with open(self.fixture, 'rb') as f:
+            data = f.read()
+        if self.size and self.size > len(data):
+            padded_size = -(-self.size // SECTOR_SIZE) * SECTOR_SIZE
+            data += b'\0' * (padded_size - len(data))
+        return data
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Request handler serving the report page, its assets and the Excel export."""
+
+    # Set per server by start_server
+    config = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/data/pdfdatareport':
+            self._report_page(parse_qs(url.query))
+        elif url.path.startswith('/static/'):
+            self._asset(url.path)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/data/export':
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        self.config.exports.append({name: values[0] for name, values in form.items()})
+        report_code = form.get('reportCode', ['D1A'])[0]
+        report_date = form.get('reportDate', [''])[0]
+        if form.get('format', ['excel'])[0] != 'excel':
+            self.send_error(400, "Only the Excel export is available")
+            return
+
+        time.sleep(self.config.latency)
+        if self.config.challenge:
+            page = CHALLENGE_PAGE.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+            return
+
+        data = self.config.workbook
+        file_date = report_date.replace('/', '-') or 'latest'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.ms-excel')
+        self.send_header('Content-Disposition', f'attachment; filename="{report_code}_{file_date}.xls"')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+
+        # Stream the workbook in chunks
+        for start in range(0, len(data), self.config.chunk_size):
+            self.wfile.write(data[start:start + self.config.chunk_size])
+            if self.config.chunk_delay:
+                time.sleep(self.config.chunk_delay)
+
+    def _report_page(self, query):
+        time.sleep(self.config.page_latency)
+        cookies = SimpleCookie(self.headers.get('Cookie', ''))
+        default_date = (datetime.now() - timedelta(days=1)).strftime('%d/%m/%Y')
+        page = REPORT_PAGE.format(
+            report_code=query.get('reportCode', ['D1A'])[0],
+            default_date=default_date,
+            banner_style='display:none;' if CONSENT_COOKIE in cookies else '',
+            consent_cookie=CONSENT_COOKIE
+        ).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def _asset(self, path):
+        # Stand-ins for the images and icons the real page loads
+        content_type = 'image/png' if path.endswith('.png') else 'image/x-icon'
+        data = b'\0' * self.config.asset_size
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+def start_server(config=None, host='127.0.0.1', port=0, quiet=True):
+    """
+    Start the stand-in server in a background thread.
+
+    Args:
+        config (StandinConfig, optional): Server behaviour. Defaults to StandinConfig().
+        host (str): Address to listen on.
+        port (int): Port to listen on; 0 picks a free port.
+        quiet (bool): Do not log each request.
+
+    Returns:
+        tuple: (server, base_url), where base_url is the report page URL to pass to
+        download_gilts_data. Call server.shutdown() to stop it.
+    """
+    handler = type('ConfiguredStandinHandler', (StandinHandler,), {'config': config or StandinConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.quiet = quiet
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/data/pdfdatareport"
+    return server, base_url
+
+def main():
+    """Run the stand-in server until interrupted."""
+    parser = argparse.ArgumentParser(description="Local stand-in for the DMO report page.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE, help="Workbook served by the Excel export")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds to wait before answering an export request")
+    parser.add_argument('--page-latency', type=float, default=0.0,
+                        help="Seconds to wait before answering a report page request")
+    parser.add_argument('--size', type=int, help="Pad the workbook to this many bytes")
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024, help="Bytes per streamed chunk")
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument('--challenge', action='store_true',
+                        help="Answer exports with an HTML bot challenge instead of the workbook")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        fixture=args.fixture,
+        latency=args.latency,
+        page_latency=args.page_latency,
+        size=args.size,
+        chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay,
+        challenge=args.challenge
+    )
+    server, base_url = start_server(config, args.host, args.port, quiet=not args.verbose)
+    print(f"Serving DMO stand-in at {base_url}?reportCode=D1A")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Stopping stand-in server")
+        server.shutdown()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -5,216 +5,2152 @@ This script handles the entire process from downloading the Excel file from the
 to converting it to a properly formatted CSV file.
 """
 import os
+import io
 import sys
 import csv
 import glob
+import argparse
+import re
+import json
+import shutil
+import threading
+import hashlib
 import random
 import xlrd
+import requests
 import asyncio
 import traceback
-from datetime import datetime, timedelta
-from playwright.async_api import async_playwright
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager, redirect_stdout, redirect_stderr
+from datetime import datetime, date as date_type, timedelta, time as dt_time
+from decimal import Decimal
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
-async def download_gilts_data(date_str=None):
+# DMO report page for the Gilts in Issue data
+DMO_REPORT_URL = "https://www.dmo.gov.uk/data/pdfdatareport"
+GILTS_REPORT_CODE = "D1A"
+GILTS_REPORT_URL = f"{DMO_REPORT_URL}?reportCode={GILTS_REPORT_CODE}"
+
+# File name prefix of each report's downloads; other reports use dmo_<code>
+REPORT_FILE_PREFIXES = {
+    GILTS_REPORT_CODE: 'gilts_in_issue'
+}
+
+# Working files (recorded requests, caches) kept between runs
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.gilts_cache')
+SELECTOR_CACHE_FILE = os.path.join(CACHE_DIR, 'selectors.json')
+STORAGE_STATE_FILE = os.path.join(CACHE_DIR, 'storage_state.json')
+JOURNAL_FILE = os.path.join(CACHE_DIR, 'backfill_journal.jsonl')
+# Kept in each CSV output directory, next to the files it describes
+
+# Leading bytes of .xls (OLE2 compound document) and .xlsx (ZIP) files
+OLE2_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+# Seconds allowed for each step of a browser download
+DEFAULT_STEP_TIMEOUTS = {
+    'navigation': 60,
+    'page_ready': 30,
+    'consent': 5,
+    'date': 10,
+    'click': 10,
+    'download_start': 30,
+    'download_complete': 30
+}
+
+# Selectors tried, in order, to find the Excel export button
+EXCEL_SELECTORS = [
+    'button:has-text("Excel")',
+    'input[value*="Excel"]',
+    'a:has-text("Excel")',
+    '.btn:has-text("Excel")',
+    'button[id*="excel"]',
+    'button[class*="excel"]'
+]
+
+# Resource types that are not needed to find and click the export button
+BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font', 'texttrack', 'manifest', 'ping')
+
+# Domains (and their subdomains) allowed to load when resource blocking is on.
+# The cookie consent provider is kept so the banner still works.
+ALLOWED_DOMAINS = ('dmo.gov.uk', 'cookielaw.org', 'onetrust.com')
+
+# Selectors tried, in order, to find the cookie consent button
+COOKIE_SELECTORS = [
+    "button:has-text('Accept')",
+    "button:has-text('Accept All')",
+    "button:has-text('Accept Cookies')",
+    "button:has-text('I Accept')",
+    "button:has-text('OK')",
+    "button:has-text('Agree')",
+    "#onetrust-accept-btn-handler",
+    ".cookie-accept-button",
+    ".accept-cookies"
+]
+
+# Selectors tried, in order, to find the report date input
+DATE_SELECTORS = [
+    'input[type="date"]',
+    'input[name*="date" i]:not([type="hidden"])',
+    'input[id*="date" i]:not([type="hidden"])',
+    'input[placeholder*="dd/mm/yyyy" i]'
+]
+
+# Every control looked up on the report page, with its candidate selectors
+CONTROL_SELECTORS = {
+    'consent': COOKIE_SELECTORS,
+    'date': DATE_SELECTORS,
+    'excel': EXCEL_SELECTORS
+}
+
+# Playwright-only :has-text() suffix, matched in the page by _discover_controls
+HAS_TEXT_PATTERN = re.compile(r'^(.*):has-text\((["\'])(.*)\2\)$')
+
+# Runs in the page: for each group of [css, text] candidates, tags the first
+# element matching the earliest candidate and reports which candidate it was.
+# Like :has-text(), text matching is a case-insensitive substring test.
+DISCOVERY_SCRIPT = """
+(groups) => {
+    document.querySelectorAll('[data-gilts-control]').forEach(element => {
+        element.removeAttribute('data-gilts-control');
+    });
+    const found = {};
+    for (const [name, candidates] of Object.entries(groups)) {
+        found[name] = null;
+        for (let i = 0; i < candidates.length && !found[name]; i++) {
+            const [css, text] = candidates[i];
+            let elements = [];
+            try {
+                elements = document.querySelectorAll(css);
+            } catch (e) {
+                continue;
+            }
+            for (const element of elements) {
+                const content = element.textContent || element.value || '';
+                if (!text || content.toLowerCase().includes(text.toLowerCase())) {
+                    element.setAttribute('data-gilts-control', name);
+                    found[name] = {index: i, type: element.type || null};
+                    break;
+                }
+            }
+        }
+    }
+    return found;
+}
+"""
+
+# Date formats that may appear in the report title row, with a regex to find each
+TITLE_DATE_FORMATS = [
+    (r'\d{1,2} [A-Za-z]+ \d{4}', '%d %B %Y'),
+    (r'\d{1,2} [A-Za-z]{3} \d{4}', '%d %b %Y'),
+    (r'\d{1,2}-[A-Za-z]{3}-\d{4}', '%d-%b-%Y'),
+    (r'\d{2}/\d{2}/\d{4}', '%d/%m/%Y')
+]
+
+# Version of the CSV conversion; bump it whenever the output of format_gilts_csv or
+# export_typed_csv changes, so that earlier conversions are redone
+CONVERTER_VERSION = 1
+
+# Layout of the Gilts in Issue sheet: the total amount row, how far down to look for
+# the column headers, and the group labels that are left out of the CSV
+TOTAL_ROW_INDEX = 5
+HEADER_SCAN_ROWS = 15
+GROUP_LABELS = ('Ultra-Short', 'Short', 'Medium', 'Long')
+
+# Playwright browser engines that can run the download
+BROWSER_ENGINES = ('chromium', 'firefox', 'webkit')
+
+# Bytes read at a time while hashing downloads
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Options shared by every browser context so that pooled and one-off contexts
+# look the same to the DMO website
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1280, 'height': 800},
+    'user_agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+    'accept_downloads': True,
+    'locale': 'en-GB',
+    'timezone_id': 'Europe/London'
+}
+
+async def _new_context(browser, blocking_profile=None):
+    """Create a browser context configured for the DMO website."""
+    # Start from the saved cookies and localStorage if the cookie consent is still valid
+    options = dict(CONTEXT_OPTIONS)
+    consent_state = _load_consent_state()
+    if consent_state:
+        options['storage_state'] = consent_state['state']
+    
+    # Use a browser context with options to appear more human-like
+    context = await browser.new_context(**options)
+    if blocking_profile:
+        await blocking_profile.apply(context)
+    
+    # Add some human-like behaviors
+    # 1. Enable JavaScript and cookies
+    await context.add_cookies([{
+        'name': 'user_preference',
+        'value': 'accepted',
+        'domain': 'www.dmo.gov.uk',
+        'path': '/'
+    }])
+    return context
+
+def _cookie_alive(cookie, now):
+    """Check whether a cookie from context.cookies() or a storage state has not expired."""
+    expires = cookie.get('expires', -1)
+    return expires == -1 or expires > now
+
+async def _save_consent_state(context, cookies_before):
+    """
+    Save the context's storage state after the cookie banner has been accepted.
+    
+    The cookies that the click added or changed are recorded as the consent
+    cookies, so later runs can tell whether the consent is still valid.
+    
+    Args:
+        context: Browser context the banner was accepted in.
+        cookies_before (list): context.cookies() from just before the click.
+    """
+    try:
+        before = {(cookie['name'], cookie['value']) for cookie in cookies_before}
+        consent_cookies = sorted({
+            cookie['name'] for cookie in await context.cookies()
+            if (cookie['name'], cookie['value']) not in before
+        })
+        record = {
+            'saved_at': datetime.now().isoformat(),
+            'consent_cookies': consent_cookies,
+            'state': await context.storage_state()
+        }
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp_path = f"{STORAGE_STATE_FILE}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(record, f, indent=2)
+        os.replace(temp_path, STORAGE_STATE_FILE)
+        print(f"Saved browser storage state with consent cookies: {consent_cookies}")
+    except Exception as e:
+        print(f"Error saving browser storage state: {e}")
+
+def _load_consent_state():
+    """
+    Load the saved storage state if its consent cookies have not expired.
+    
+    Returns:
+        dict: The record written by _save_consent_state, or None if there is no valid consent
+    """
+    try:
+        with open(STORAGE_STATE_FILE) as f:
+            record = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading browser storage state: {e}")
+        return None
+    
+    now = time.time()
+    alive = {cookie['name'] for cookie in record['state'].get('cookies', []) if _cookie_alive(cookie, now)}
+    if not set(record['consent_cookies']) <= alive:
+        print("Saved cookie consent has expired")
+        return None
+    return record
+
+async def _has_valid_consent(context):
+    """Check whether a context still holds the cookies set by accepting the banner."""
+    record = _load_consent_state()
+    # Consent kept only in localStorage cannot be checked, so look for the banner as usual
+    if not record or not record['consent_cookies']:
+        return False
+    now = time.time()
+    alive = {cookie['name'] for cookie in await context.cookies() if _cookie_alive(cookie, now)}
+    return set(record['consent_cookies']) <= alive
+
+class ResourceBlockingProfile:
+    """
+    Request routing rules that abort resources the download does not need.
+    
+    Requests are aborted when their resource type is in blocked_types or their
+    host is not one of allowed_domains (or a subdomain of one). Counters of
+    allowed and aborted requests are kept for reporting.
+    
+    Args:
+        blocked_types (iterable): Playwright resource types to abort.
+        allowed_domains (iterable): Domains allowed to load. None allows every domain.
+    """
+    
+    def __init__(self, blocked_types=BLOCKED_RESOURCE_TYPES, allowed_domains=ALLOWED_DOMAINS):
+        self.blocked_types = set(blocked_types)
+        self.allowed_domains = None if allowed_domains is None else tuple(allowed_domains)
+        self.allowed = 0
+        self.aborted = 0
+    
+    def allows(self, url, resource_type):
+        """Check whether a request should be let through."""
+        if resource_type in self.blocked_types:
+            return False
+        if self.allowed_domains is None:
+            return True
+        host = urlparse(url).hostname or ''
+        return any(host == domain or host.endswith('.' + domain) for domain in self.allowed_domains)
+    
+    async def apply(self, context):
+        """Install the routing rules on a browser context."""
+        await context.route('**/*', self._handle_route)
+    
+    async def _handle_route(self, route):
+        request = route.request
+        if self.allows(request.url, request.resource_type):
+            self.allowed += 1
+            await route.continue_()
+        else:
+            self.aborted += 1
+            await route.abort()
+
+class BrowserPool:
+    """
+    Pool of warm browser contexts that can be shared between downloads.
+    
+    The browser is launched once, on first use, and contexts are borrowed with
+    acquire() and handed back with release() (or both at once with the
+    context() async context manager). Returned contexts are kept open for reuse
+    until they have been idle for longer than idle_timeout seconds.
+    
+    Args:
+        size (int): Maximum number of contexts that can be borrowed at the same time.
+        idle_timeout (float): Seconds an unused context is kept open before it is closed.
+        headless (bool): Whether to launch the browser in headless mode.
+        launch_options (dict, optional): Extra keyword arguments for the browser launch.
+        blocking_profile (ResourceBlockingProfile, optional): Routing rules installed on
+            every context the pool creates.
+        cdp_endpoint (str, optional): Attach to an already running Chromium at this CDP
+            endpoint (e.g. http://127.0.0.1:9222) instead of launching one. The pool only
+            creates and closes its own contexts there; the browser is left running.
+        engine (str): Browser engine to launch, one of BROWSER_ENGINES.
+    """
+    
+    def __init__(self, size=2, idle_timeout=300, headless=False, launch_options=None,
+                 blocking_profile=None, cdp_endpoint=None, engine='chromium'):
+        if size < 1:
+            raise ValueError("Browser pool size must be at least 1")
+        if engine not in BROWSER_ENGINES:
+            raise ValueError(f"Unknown browser engine {engine!r}, expected one of {', '.join(BROWSER_ENGINES)}")
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.headless = headless
+        self.launch_options = launch_options or {}
+        self.blocking_profile = blocking_profile
+        self.cdp_endpoint = cdp_endpoint
+        self.engine = engine
+        self._playwright = None
+        self._browser = None
+        self._idle = []  # (context, time it was returned to the pool)
+        self._slots = asyncio.Semaphore(size)
+        self._start_lock = asyncio.Lock()
+        self._reaper = None
+    
+    async def __aenter__(self):
+        # The browser is launched lazily, so a pool that is never used costs nothing
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def start(self):
+        """
+        Launch the browser (or attach to the CDP endpoint) if it is not already running.
+        
+        A browser that has crashed or been disconnected since the last call is
+        dropped, together with its idle contexts, and a new one is launched.
+        """
+        async with self._start_lock:
+            if self._browser is not None and not self._browser.is_connected():
+                print("Browser is no longer connected, relaunching it")
+                await self._drop_browser()
+            if self._browser is None:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                browser_type = getattr(self._playwright, self.engine)
+                if self.cdp_endpoint and self.engine == 'chromium':
+                    self._browser = await self._connect(browser_type)
+                elif self.cdp_endpoint:
+                    print(f"CDP attach is only available for chromium, launching {self.engine}")
+                if self._browser is None:
+                    self._browser = await browser_type.launch(headless=self.headless, **self.launch_options)
+                if self._reaper is None:
+                    self._reaper = asyncio.create_task(self._reap_idle())
+        return self
+    
+    async def _drop_browser(self):
+        # The idle contexts belonged to the old browser and cannot be reused
+        idle, self._idle = self._idle, []
+        for context, _ in idle:
+            await _close_quietly(context)
+        browser, self._browser = self._browser, None
+        await _close_quietly(browser)
+    
+    async def _connect(self, browser_type):
+        # Attaching skips the launch entirely; if the endpoint is down, launch instead
+        try:
+            browser = await browser_type.connect_over_cdp(self.cdp_endpoint)
+            print(f"Attached to running browser at {self.cdp_endpoint}")
+            return browser
+        except Exception as e:
+            print(f"Could not attach to browser at {self.cdp_endpoint}, launching one instead: {e}")
+            return None
+    
+    async def acquire(self):
+        """
+        Borrow a context from the pool, waiting if all of them are in use.
+        
+        Returns:
+            BrowserContext: A context that must be given back with release()
+        """
+        await self._slots.acquire()
+        try:
+            await self.start()
+            await self.evict_idle()
+            if self._idle:
+                context, _ = self._idle.pop()
+                return context
+            return await _new_context(self._browser, self.blocking_profile)
+        except BaseException:
+            self._slots.release()
+            raise
+    
+    async def release(self, context, discard=False):
+        """
+        Give a borrowed context back to the pool.
+        
+        Args:
+            context: The context returned by acquire().
+            discard (bool): Close the context instead of keeping it for reuse,
+                e.g. after an error left it in an unknown state.
+        """
+        try:
+            if discard or not self._owns(context):
+                await _close_quietly(context)
+            else:
+                # Leave a clean context behind for the next borrower
+                for page in list(context.pages):
+                    await _close_quietly(page)
+                self._idle.append((context, time.monotonic()))
+        finally:
+            self._slots.release()
+    
+    def _owns(self, context):
+        # A context borrowed before the browser was relaunched is not worth keeping
+        return (self._browser is not None and self._browser.is_connected()
+                and context.browser is self._browser)
+    
+    @asynccontextmanager
+    async def context(self):
+        """Borrow a context for the duration of an async with block."""
+        context = await self.acquire()
+        discard = False
+        try:
+            yield context
+        except BaseException:
+            discard = True
+            raise
+        finally:
+            await self.release(context, discard=discard)
+    
+    async def evict_idle(self):
+        """Close contexts that have been idle for longer than idle_timeout."""
+        now = time.monotonic()
+        expired = [context for context, returned in self._idle if now - returned >= self.idle_timeout]
+        self._idle = [(context, returned) for context, returned in self._idle if context not in expired]
+        for context in expired:
+            await _close_quietly(context)
+    
+    async def _reap_idle(self):
+        # Evict idle contexts even when nobody is using the pool
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            await self.evict_idle()
+    
+    async def close(self):
+        """Close all pooled contexts, the browser and Playwright."""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        for context, _ in self._idle:
+            await _close_quietly(context)
+        self._idle = []
+        if self._browser:
+            # For an attached browser this only disconnects; the browser keeps running
+            await _close_quietly(self._browser)
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+class TimeBudget:
+    """
+    Overall time limit for a download, shared out as per-step timeouts.
+    
+    Each step gets its own timeout from DEFAULT_STEP_TIMEOUTS (or step_timeouts),
+    capped by whatever is left of the overall budget.
+    
+    Args:
+        total (float, optional): Seconds allowed for the whole download. None means no overall limit.
+        step_timeouts (dict, optional): Per-step timeouts in seconds, overriding the defaults.
+    """
+    
+    def __init__(self, total=None, step_timeouts=None):
+        self.deadline = None if total is None else time.monotonic() + total
+        self.step_timeouts = {**DEFAULT_STEP_TIMEOUTS, **(step_timeouts or {})}
+    
+    def timeout(self, step):
+        """Seconds allowed for a step."""
+        limit = self.step_timeouts[step]
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Time budget used up before step '{step}'")
+            limit = min(limit, remaining)
+        return limit
+    
+    def timeout_ms(self, step):
+        """Milliseconds allowed for a step, as Playwright expects."""
+        return self.timeout(step) * 1000
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for DMO requests that adapts to how the site responds.
+    
+    The limit grows by one after a full round of fast, valid workbooks (one per
+    request allowed at the current limit). It drops by one after a slow or failed
+    response, and is halved after a response that is not a workbook (usually an
+    HTML bot challenge), with all requests paused for a cooldown.
+    
+    Args:
+        initial (int): Requests allowed at once to start with.
+        minimum (int): Lowest the limit can fall to.
+        maximum (int): Highest the limit can rise to.
+        slow_response (float): Seconds after which a response counts as slow.
+        cooldown (float): Seconds to pause all requests after a challenge page.
+    """
+    
+    def __init__(self, initial=2, minimum=1, maximum=8, slow_response=20.0, cooldown=30.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.slow_response = slow_response
+        self.cooldown = cooldown
+        self.active = 0
+        self.successes = 0
+        self.challenges = 0
+        self._paused_until = 0.0
+        self._changed = asyncio.Condition()
+    
+    async def acquire(self):
+        """Wait until a request may start."""
+        async with self._changed:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                elif self.active < self.limit:
+                    self.active += 1
+                    return
+                else:
+                    await self._changed.wait()
+    
+    async def release(self, data, elapsed):
+        """
+        Finish a request and adjust the limit from its outcome.
+        
+        Args:
+            data (bytes): What the request returned, or None if it failed.
+            elapsed (float): Seconds the request took.
+        """
+        async with self._changed:
+            self.active -= 1
+            self._observe(data, elapsed)
+            self._changed.notify_all()
+    
+    def _observe(self, data, elapsed):
+        if data is not None and not _is_workbook(data):
+            self.challenges += 1
+            self.successes = 0
+            self._paused_until = time.monotonic() + self.cooldown
+            self._set_limit(self.limit // 2, f"challenge page, pausing {self.cooldown:.0f}s")
+        elif data is None or elapsed > self.slow_response:
+            self.successes = 0
+            self._set_limit(self.limit - 1, "failed response" if data is None else f"slow response ({elapsed:.1f}s)")
+        else:
+            self.successes += 1
+            if self.successes >= self.limit:
+                self.successes = 0
+                self._set_limit(self.limit + 1, "responses are healthy")
+    
+    def _set_limit(self, limit, reason):
+        limit = max(self.minimum, min(limit, self.maximum))
+        if limit != self.limit:
+            print(f"Adjusting concurrent DMO requests from {self.limit} to {limit}: {reason}")
+            self.limit = limit
+    
+    async def run(self, request, timings=None):
+        """
+        Run a request once the limit allows it, and learn from its outcome.
+        
+        Args:
+            request: Coroutine function returning the downloaded bytes or None.
+            timings (dict, optional): Timings the request fills in (see _download_on_page).
+                When it has 'click_to_download', only that counts as the response time,
+                so page loads and human-like pauses are not mistaken for a slow DMO.
+        
+        Returns:
+            bytes: Whatever the request returned. Exceptions are re-raised after
+            being counted as a failed response.
+        """
+        await self.acquire()
+        started = time.monotonic()
+        data = None
+        try:
+            data = await request()
+            return data
+        finally:
+            elapsed = time.monotonic() - started
+            if timings and 'click_to_download' in timings:
+                elapsed = timings['click_to_download']
+            await self.release(data, elapsed)
+
+async def _limited(limiter, request, timings=None):
+    """Run a request through the limiter, or directly if there is none."""
+    if limiter is None:
+        return await request()
+    return await limiter.run(request, timings)
+
+async def _human_pause(fast, low, high):
+    """Sleep for a random interval to mimic a human, unless running in fast mode."""
+    if not fast:
+        await asyncio.sleep(random.uniform(low, high))
+
+async def _close_quietly(target):
+    """Close a page, context or browser, ignoring errors if it is already gone."""
+    try:
+        await target.close()
+    except Exception as e:
+        print(f"Error closing {type(target).__name__}: {e}")
+
+async def fetch_reports(report_codes, date_str=None, pool=None, strict_date=False, replay=False,
+                        fast=False, time_budget=None, step_timeouts=None, debug=False,
+                        base_url=DMO_REPORT_URL, limiter=None, page_date=False):
+    """
+    Fetch the Excel export of several DMO reports as bytes, without saving them.
+    
+    All reports share one browser context, each on its own page. The first report
+    is fetched alone so that the cookie banner is handled once for the whole
+    batch; the rest are then fetched concurrently.
+    
+    Args:
+        report_codes (list): DMO report codes, e.g. ['D1A', 'D5D'].
+        date_str (str, optional): Date in format 'DD/MM/YYYY'. If None, yesterday's date is used.
+        pool (BrowserPool, optional): Pool to borrow a browser context from. If None, a
+            browser is launched for this call only.
+        strict_date (bool): Fail instead of falling back to the page's default date when
+            the date input cannot be filled.
+        replay (bool): Fetch the files by replaying the export requests recorded on earlier
+            browser downloads, falling back to the browser for reports where that fails.
+            Browser downloads made in this mode record the request for next time.
+        fast (bool): Latency-optimised mode: no human-like pauses, and every wait ends
+            as soon as its page or download event fires.
+        time_budget (float, optional): Overall limit in seconds for each report's browser download.
+        step_timeouts (dict, optional): Per-step limits in seconds, overriding
+            DEFAULT_STEP_TIMEOUTS.
+        debug (bool): Print every input and button on the report pages.
+        base_url (str): Report page URL without the query string. Point it at a local
+            stand-in (see dmo_standin_server.py) to test or benchmark offline.
+        limiter (AdaptiveLimiter, optional): Limit on concurrent requests to DMO, shared
+            between calls. Each replayed request and browser export goes through it.
+        page_date (bool): Leave the date input alone and export whatever date the report
+            page shows by default, i.e. the latest publication. date_str is ignored, and so
+            is replay, since a recorded request always asks for one fixed date.
+    
+    Returns:
+        dict: Report code mapped to the file contents, or None if that download failed
+    """
+    if page_date:
+        date_str = None
+        replay = False
+        print(f"Attempting to download {', '.join(report_codes)} data for the report page's default date")
+    else:
+        # If no date provided, use yesterday's date
+        if not date_str:
+            date_str = _default_date()
+        print(f"Attempting to download {', '.join(report_codes)} data for date: {date_str}")
+    results = {}
+    
+    # Try the plain HTTP fast path first
+    if replay:
+        replayed = await asyncio.gather(*(_replay_fetch(date_str, code, limiter, strict_date)
+                                          for code in report_codes))
+        results.update((code, data) for code, data in zip(report_codes, replayed) if data)
+    pending = [code for code in report_codes if code not in results]
+    if not pending:
+        return results
+    if replay:
+        print(f"Falling back to browser download for {', '.join(pending)}...")
+    
+    # Without a shared pool, launch a browser just for this download
+    own_pool = pool is None
+    if own_pool:
+        pool = BrowserPool(size=1)
+    
+    try:
+        async with pool.context() as context:
+            async def fetch(report_code):
+                # Create a new page; the budget starts once its browser flow begins
+                page = await context.new_page()
+                # The limiter judges DMO by the export itself, not the page load before it
+                timings = {}
+                try:
+                    return await _limited(limiter, lambda: _download_on_page(
+                        page, date_str, report_code=report_code, strict_date=strict_date,
+                        capture_export=replay, fast=fast, budget=TimeBudget(time_budget, step_timeouts),
+                        debug=debug, base_url=base_url, timings=timings, page_date=page_date), timings)
+                finally:
+                    await _close_quietly(page)
+            
+            results[pending[0]] = await fetch(pending[0])
+            others = await asyncio.gather(*(fetch(code) for code in pending[1:]))
+            results.update(zip(pending[1:], others))
+    except Exception as e:
+        print(f"Error during download: {e}")
+    finally:
+        if own_pool:
+            # Close the browser
+            await pool.close()
+    
+    return {code: results.get(code) for code in report_codes}
+
+async def fetch_gilts_workbook(date_str=None, pool=None, report_code=GILTS_REPORT_CODE, **fetch_options):
+    """
+    Fetch the Gilts in Issue Excel file from the DMO website as bytes, without saving it.
+    
+    Args:
+        date_str (str, optional): Date in format 'DD/MM/YYYY'. If None, yesterday's date is used.
+        pool (BrowserPool, optional): Pool to borrow a browser context from. If None, a
+            browser is launched for this call only.
+        report_code (str): DMO report to export. Defaults to Gilts in Issue (D1A).
+        **fetch_options: Passed on to fetch_reports (strict_date, replay, fast, time_budget,
+            step_timeouts, debug, base_url, limiter).
+    
+    Returns:
+        bytes: Contents of the downloaded file, or None if the download failed
+    """
+    results = await fetch_reports([report_code], date_str, pool=pool, **fetch_options)
+    return results.get(report_code)
+
+async def download_gilts_data(date_str=None, pool=None, **fetch_options):
+    """
+    Download Gilts in Issue data from the UK Debt Management Office website using Playwright.
+    
+    Args:
+        date_str (str, optional): Date in format 'DD/MM/YYYY'. If None, yesterday's date is used.
+        pool (BrowserPool, optional): Pool to borrow a browser context from. If None, a
+            browser is launched for this call only.
+        **fetch_options: Passed on to fetch_reports (strict_date, replay, fast, ...).
+    
+    Returns:
+        str: Path to the downloaded file
+    """
+    if not date_str:
+        date_str = _default_date()
+    
+    data = await fetch_gilts_workbook(date_str, pool=pool, **fetch_options)
+    if data is None:
+        return None
+    
+    output_file = _output_path(_downloads_dir(), date_str, data=data)
+    _archive_download(data, output_file)
+    print(f"Successfully downloaded Gilts data to: {output_file}")
+    return output_file
+
+async def download_reports(report_codes, date_str=None, pool=None, **fetch_options):
+    """
+    Download several DMO reports in one browser session and save each under its own name.
+    
+    Files are named after REPORT_FILE_PREFIXES (e.g. gilts_in_issue_DD-MM-YYYY.xls for D1A,
+    dmo_<code>_DD-MM-YYYY.xls for other reports).
+    
+    Args:
+        report_codes (list): DMO report codes, e.g. ['D1A', 'D5D'].
+        date_str (str, optional): Date in format 'DD/MM/YYYY'. If None, yesterday's date is used.
+        pool (BrowserPool, optional): Pool to borrow a browser context from.
+        **fetch_options: Passed on to fetch_reports (strict_date, replay, fast, ...).
+    
+    Returns:
+        dict: Report code mapped to the downloaded file path, or None if that download failed
+    """
+    if not date_str:
+        date_str = _default_date()
+    
+    results = await fetch_reports(report_codes, date_str, pool=pool, **fetch_options)
+    paths = {}
+    for report_code, data in results.items():
+        paths[report_code] = None
+        if data is not None:
+            output_file = _output_path(_downloads_dir(), date_str, report_code, data)
+            _archive_download(data, output_file)
+            print(f"Successfully downloaded {report_code} data to: {output_file}")
+            paths[report_code] = output_file
+    return paths
+
+async def download_and_convert(date_str=None, pool=None, archive=True, output_dir=None, typed=False,
+                               **fetch_options):
+    """
+    Download the Excel file and convert it to CSV straight from memory.
+    
+    The downloaded bytes go directly to the parser. Saving the raw file in the
+    downloads directory happens in a background thread while the conversion runs.
+    
+    Args:
+        date_str (str, optional): Date in format 'DD/MM/YYYY'. If None, yesterday's date is used.
+        pool (BrowserPool, optional): Pool to borrow a browser context from.
+        archive (bool): Also save the raw Excel file in the downloads directory.
+        output_dir (str, optional): Directory for the CSV file. Defaults to 'csv_exports'.
+        typed (bool): Also write the typed CSV (see export_typed_csv).
+        **fetch_options: Passed on to fetch_gilts_workbook (replay, fast, ...).
+    
+    Returns:
+        str: Path to the created CSV file or None if the download or conversion failed
+    """
+    if not date_str:
+        date_str = _default_date()
+    
+    data = await fetch_gilts_workbook(date_str, pool=pool, **fetch_options)
+    if data is None:
+        return None
+    if not _is_workbook(data):
+        print("Warning: Downloaded file appears to be HTML, not Excel.")
+        print("Bot protection may still be active.")
+        return None
+    
+    archive_task = None
+    if archive:
+        output_file = _output_path(_downloads_dir(), date_str, data=data)
+        archive_task = asyncio.create_task(asyncio.to_thread(_archive_download, data, output_file))
+    
+    try:
+        csv_path = await asyncio.to_thread(convert_deduplicated, file_contents=data, date_str=date_str,
+                                           output_dir=output_dir)
+        if csv_path and typed:
+            await asyncio.to_thread(export_typed_csv, output_dir=output_dir, file_contents=data,
+                                    date_str=date_str)
+        return csv_path
+    finally:
+        if archive_task:
+            try:
+                await archive_task
+                print(f"Archived Excel file to: {output_file}")
+            except OSError as e:
+                print(f"Error archiving Excel file: {e}")
+
+async def _download_on_page(page, date_str, report_code=GILTS_REPORT_CODE, strict_date=False,
+                            capture_export=False, fast=False, budget=None, debug=False,
+                            selector_cache=None, base_url=DMO_REPORT_URL, timings=None, page_date=False):
+    """
+    Drive the DMO report page to export the Excel file.
+    
+    Args:
+        page: Playwright page to use.
+        date_str (str): Date in format 'DD/MM/YYYY'.
+        report_code (str): DMO report to export.
+        strict_date (bool): Give up if the date input cannot be filled rather than
+            downloading the page's default date under date_str's name.
+        capture_export (bool): Record the export request for later HTTP replay.
+        fast (bool): Skip the human-like pauses and move on as soon as each step completes.
+        budget (TimeBudget, optional): Time limits for the steps. Defaults to TimeBudget().
+        debug (bool): Print every input and button on the page.
+        selector_cache (SelectorCache, optional): Learned selectors to try first. Defaults
+            to the cache shared by all downloads in this process.
+        base_url (str): Report page URL without the query string.
+        timings (dict, optional): Filled in with the seconds taken by 'navigation' (until
+            the page is ready) and 'click_to_download' (from the Excel click until the file
+            is complete).
+        page_date (bool): Export the date the page shows by default instead of date_str.
+    
+    Returns:
+        bytes: Contents of the downloaded file, or None if the download failed
+    """
+    # URL of the report page
+    report_url = _report_url(report_code, base_url)
+    
+    if budget is None:
+        budget = TimeBudget()
+    if selector_cache is None:
+        selector_cache = _shared_selector_cache()
+    
+    try:
+        # Navigate to the DMO website with a timeout
+        print("Navigating to DMO website...")
+        started = time.monotonic()
+        if fast:
+            # Carry on as soon as the export button exists instead of waiting for the network to go quiet
+            await page.goto(report_url, wait_until='domcontentloaded', timeout=budget.timeout_ms('navigation'))
+            await page.wait_for_selector(', '.join(EXCEL_SELECTORS), state='attached',
+                                         timeout=budget.timeout_ms('page_ready'))
+        else:
+            await page.goto(report_url, wait_until='networkidle', timeout=budget.timeout_ms('navigation'))
+        if timings is not None:
+            timings['navigation'] = time.monotonic() - started
+        
+        # Add a random delay to mimic human behavior
+        await _human_pause(fast, 1.5, 3.0)
+        
+        # A context that already holds the saved consent has nothing to click
+        consent_valid = await _has_valid_consent(page.context)
+        if consent_valid:
+            print("Cookie consent still valid, skipping cookie popup")
+        
+        # Find the cookie banner, date input and Excel button in one round-trip
+        print("Looking for cookie popup, date input and Excel button...")
+        # Selectors that matched on earlier runs are tried first
+        controls = await _discover_controls(page, {
+            name: selector_cache.ordered(report_code, name, selectors)
+            for name, selectors in CONTROL_SELECTORS.items()
+            if not (consent_valid and name == 'consent')
+        })
+        for name, control in controls.items():
+            if control:
+                selector_cache.learn(report_code, name, control['selector'])
+        
+        if debug:
+            await _dump_page_controls(page)
+        
+        # Handle cookie popup if it appears
+        cookie_button = controls.get('consent')
+        if cookie_button:
+            try:
+                cookies_before = await page.context.cookies()
+                print(f"Found cookie popup, clicking {cookie_button['selector']}...")
+                await cookie_button['locator'].click(timeout=budget.timeout_ms('consent'))
+                print("Accepted cookies")
+                # Wait for popup to disappear
+                if fast:
+                    await cookie_button['locator'].wait_for(state='hidden', timeout=budget.timeout_ms('consent'))
+                else:
+                    await _human_pause(fast, 1.0, 2.0)
+                # Keep the consent for the next run
+                await _save_consent_state(page.context, cookies_before)
+            except Exception as e:
+                print(f"Error handling cookie popup: {e}")
+        
+        # Set the report date
+        if page_date:
+            print("Using the report page's default date")
+        else:
+            date_set = await _set_report_date(controls['date'], date_str, budget)
+            if not date_set and strict_date:
+                print(f"Could not set report date to {date_str}, skipping download")
+                return None
+            
+            # Add a random delay to mimic human behavior
+            await _human_pause(fast, 1.0, 2.0)
+        
+        # Record requests so the one behind the download can be replayed over HTTP
+        export_requests = []
+        if capture_export:
+            page.on('request', export_requests.append)
+        
+        excel_button = controls['excel']
+        if excel_button:
+            # Click the button directly - no need for human-like motion
+            
+            # Click the button and wait for the download it triggers
+            download_path = None
+            try:
+                print(f"Clicking Excel button found with selector: {excel_button['selector']}")
+                clicked = time.monotonic()
+                async with page.expect_download(timeout=budget.timeout_ms('download_start')) as download_info:
+                    await excel_button['locator'].click(timeout=budget.timeout_ms('click'))
+                    print("Clicked Excel button")
+                download = await download_info.value
+                print("Download started...")
+                
+                # Remember the request behind the download so it can be replayed over HTTP
+                if capture_export:
+                    for request in reversed(export_requests):
+                        if request.url == download.url:
+                            await _save_export_request(page.context, request, date_str, report_code)
+                            break
+                
+                # Wait for download to complete
+                print("Waiting for download to complete...")
+                download_path = await asyncio.wait_for(download.path(), budget.timeout('download_complete'))
+                print(f"Download completed: {download_path}")
+                if timings is not None:
+                    timings['click_to_download'] = time.monotonic() - clicked
+            except (PlaywrightTimeoutError, asyncio.TimeoutError):
+                pass
+            
+            if download_path:
+                # Read the file from Playwright's temp directory; it is saved (or not) by the caller
+                return DownloadedWorkbook(_read_chunks(download_path))
+            else:
+                print("Download failed or timed out")
+        else:
+            print("Could not find Excel button")
+    
+    except Exception as e:
+        print(f"Error during download: {e}")
+    
+    return None
+
+def _default_date():
+    """Yesterday's date in format 'DD/MM/YYYY'."""
+    yesterday = datetime.now() - timedelta(days=1)
+    return yesterday.strftime('%d/%m/%Y')
+
+def _downloads_dir():
+    """The downloads directory next to this script, created if needed."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    output_dir = os.path.join(script_dir, "downloads")
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+class DownloadedWorkbook(bytes):
+    """
+    Downloaded file contents, with the SHA-256 hex digest computed in the same pass that reads them.
+    
+    Replayed requests pass the response chunks as they stream in; browser downloads
+    pass the chunks of Playwright's temporary file once the download has finished.
+    """
+    
+    def __new__(cls, chunks):
+        hasher = hashlib.sha256()
+        parts = []
+        for chunk in chunks:
+            hasher.update(chunk)
+            parts.append(chunk)
+        workbook = super().__new__(cls, b''.join(parts))
+        workbook.sha256 = hasher.hexdigest()
+        return workbook
+
+def _content_digest(data):
+    """SHA-256 hex digest of file contents, reusing the one computed during the download."""
+    return getattr(data, 'sha256', None) or hashlib.sha256(data).hexdigest()
+
+def _read_chunks(path, chunk_size=HASH_CHUNK_SIZE):
+    """Yield a file's contents in chunks."""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def _file_digest(path):
+    """SHA-256 of a file, read in chunks."""
+    return DownloadedWorkbook(_read_chunks(path)).sha256
+
+def _link_or_copy(source, target):
+    """Make target a hard link to source, copying instead where links are not possible."""
+    if os.path.exists(target):
+        if os.path.samefile(source, target):
+            return
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+class RawStore:
+    """
+    Content-addressed store of downloaded workbooks, keyed by SHA-256.
+    
+    Each distinct workbook is kept once as <digest>.xls (or .xlsx) and the
+    dated download names are hard links to it. The index also remembers which
+    CSV (and typed CSV) each workbook was converted to, and by which
+    CONVERTER_VERSION, so a repeated snapshot (weekends, bank holidays) can be
+    aliased instead of converted again.
+    
+    Args:
+        root (str): Directory holding the workbooks and index.json.
+    """
+    
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+        self._lock = threading.Lock()
+        self._index = self._load()
+    
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'workbooks': {}, 'aliases': {}}
+        except (OSError, ValueError) as e:
+            print(f"Error reading raw store index, starting afresh: {e}")
+            return {'workbooks': {}, 'aliases': {}}
+    
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(temp_path, self.index_path)
+    
+    def put(self, data, alias_path):
+        """
+        Store a workbook and make alias_path point at it.
+        
+        Args:
+            data (bytes): Workbook contents.
+            alias_path (str): Dated file name the workbook should also appear under.
+        
+        Returns:
+            tuple: (digest, is_new) where is_new is False if the same bytes were stored before
+        """
+        digest = _content_digest(data)
+        extension = _workbook_extension(data)
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            # The entry may already exist without a file if it was converted before being archived
+            entry = self._index['workbooks'].setdefault(digest, {'file': None, 'csv': None})
+            is_new = not entry['file'] or not os.path.exists(os.path.join(self.root, entry['file']))
+            if is_new:
+                entry['file'] = digest + extension
+                _save_workbook(data, os.path.join(self.root, entry['file']))
+            _link_or_copy(os.path.join(self.root, entry['file']), alias_path)
+            self._index['aliases'][os.path.abspath(alias_path)] = digest
+            self._save()
+        return digest, is_new
+    
+    def digest_for(self, path):
+        """Digest of a stored alias, or None if the path is not known to the store."""
+        return self._index['aliases'].get(os.path.abspath(path))
+    
+    def converted_csv(self, digest, typed=False):
+        """
+        CSV a workbook was converted to (its typed CSV if typed), or None if it has
+        not been converted by this CONVERTER_VERSION (or the CSV was deleted).
+        """
+        entry = self._index['workbooks'].get(digest)
+        key = 'typed_csv' if typed else 'csv'
+        if entry and entry.get(key) and entry.get('converter_version') == CONVERTER_VERSION \
+                and os.path.exists(entry[key]):
+            return entry[key]
+        return None
+    
+    def record_conversion(self, digest, csv_path=None, typed_csv=None):
+        """Remember the CSVs a workbook was converted to, whether or not the workbook is archived."""
+        with self._lock:
+            entry = self._index['workbooks'].setdefault(digest, {'file': None, 'csv': None})
+            if entry.get('converter_version') != CONVERTER_VERSION:
+                # Outputs of an earlier converter are not reused
+                entry['csv'] = None
+                entry.pop('typed_csv', None)
+            if csv_path:
+                entry['csv'] = os.path.abspath(csv_path)
+            if typed_csv:
+                entry['typed_csv'] = os.path.abspath(typed_csv)
+            entry['converter_version'] = CONVERTER_VERSION
+            self._save()
+
+_raw_store = None
+_raw_store_lock = threading.Lock()
+
+def _shared_raw_store():
+    """The RawStore in downloads/raw shared by all downloads in this process."""
+    global _raw_store
+    # Archiving and conversion run in different threads; both must get the same store
+    with _raw_store_lock:
+        if _raw_store is None:
+            _raw_store = RawStore(os.path.join(_downloads_dir(), 'raw'))
+    return _raw_store
+
+def _archive_download(data, output_file):
+    """Save a download under output_file, through the raw store if it is a workbook."""
+    if _is_workbook(data):
+        digest, is_new = _shared_raw_store().put(data, output_file)
+        if not is_new:
+            print(f"Same workbook as an earlier download (sha256 {digest[:12]}), stored once")
+    else:
+        _save_workbook(data, output_file)
+
+def _save_workbook(data, output_file):
+    """Write downloaded bytes to output_file, replacing any existing file atomically."""
+    # A hidden name, so the gilts_in_issue_*.xls* globs never pick up a half-written file
+    directory, name = os.path.split(output_file)
+    temp_file = os.path.join(directory, f".{name}.{os.getpid()}.part")
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+    os.replace(temp_file, output_file)
+
+def _report_url(report_code, base_url=DMO_REPORT_URL):
+    """URL of the DMO report page for a report code."""
+    return f"{base_url}?reportCode={report_code}"
+
+def _output_path(output_dir, date_str, report_code=GILTS_REPORT_CODE, data=None):
+    """
+    Path of the downloaded Excel file for a report and a date in format 'DD/MM/YYYY'.
+    
+    The extension is .xlsx if data (the downloaded bytes) is an .xlsx workbook, otherwise .xls.
+    """
+    prefix = REPORT_FILE_PREFIXES.get(report_code, f"dmo_{report_code.lower()}")
+    file_date = date_str.replace('/', '-')
+    return os.path.join(output_dir, f"{prefix}_{file_date}{_workbook_extension(data)}")
+
+def _is_workbook_file(path):
+    """Check whether a file on disk starts like an .xls or .xlsx workbook."""
+    with open(path, 'rb') as f:
+        return _is_workbook(f.read(len(OLE2_SIGNATURE)))
+
+def _workbook_extension(data):
+    """File extension for workbook bytes: .xlsx for a ZIP package, otherwise .xls."""
+    return '.xlsx' if data is not None and data[:4] == ZIP_SIGNATURE else '.xls'
+
+def _is_workbook(data):
+    """Check whether data starts like an .xls (OLE2) or .xlsx (ZIP) workbook rather than HTML."""
+    return data[:8] == OLE2_SIGNATURE or data[:4] == ZIP_SIGNATURE
+
+async def _save_export_request(context, request, date_str, report_code=GILTS_REPORT_CODE):
+    """
+    Record the request behind the Excel export so it can be replayed without a browser.
+    
+    Args:
+        context: Browser context the request was made in, used for its cookies.
+        request: Playwright request that produced the download.
+        date_str (str): Report date the request was made for, in format 'DD/MM/YYYY'.
+        report_code (str): DMO report the request exports.
+    """
+    try:
+        record = {
+            'url': request.url,
+            'method': request.method,
+            'headers': await request.all_headers(),
+            'post_data': request.post_data,
+            'cookies': await context.cookies(),
+            'date': date_str,
+            'captured_at': datetime.now().isoformat()
+        }
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_export_request_file(report_code), 'w') as f:
+            json.dump(record, f, indent=2)
+        print(f"Recorded export request: {request.method} {request.url}")
+    except Exception as e:
+        print(f"Error recording export request: {e}")
+
+def _export_request_file(report_code):
+    """File the export request of a report is recorded in."""
+    return os.path.join(CACHE_DIR, f'export_request_{report_code}.json')
+
+def _load_export_request(report_code=GILTS_REPORT_CODE):
+    """Load the recorded export request of a report, or None if there is no usable record."""
+    try:
+        with open(_export_request_file(report_code)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading export request record: {e}")
+        return None
+
+def _date_variants(date_str):
+    """The ways a 'DD/MM/YYYY' date may be written in a URL or form body."""
+    date_obj = datetime.strptime(date_str, '%d/%m/%Y')
+    return [
+        date_obj.strftime('%d/%m/%Y'),
+        date_obj.strftime('%d%%2F%m%%2F%Y'),
+        date_obj.strftime('%d%%2f%m%%2f%Y'),
+        date_obj.strftime('%Y-%m-%d')
+    ]
+
+def _replay_export_request(record, date_str, timeout=30):
+    """
+    Replay a recorded export request with requests for a different date.
+    
+    Args:
+        record (dict): Request recorded by _save_export_request.
+        date_str (str): Date to fetch in format 'DD/MM/YYYY'.
+        timeout (float): Request timeout in seconds.
+    
+    Returns:
+        bytes: The response body, or None if the recorded request does not carry its
+        date in the URL or body (e.g. it is kept in server-side state), so replaying
+        it would return the recorded date's data instead
+    """
+    url = record['url']
+    body = record.get('post_data')
+    
+    # Swap the captured date for the requested one wherever it appears
+    substituted = False
+    for old, new in zip(_date_variants(record['date']), _date_variants(date_str)):
+        if old in url or (body and old in body):
+            substituted = True
+        url = url.replace(old, new)
+        if body:
+            body = body.replace(old, new)
+    
+    if not substituted and date_str != record['date']:
+        print(f"Recorded export request does not contain its date ({record['date']}), cannot replay it for {date_str}")
+        return None
+    
+    # Cookies come from the session and the length is recomputed for the new body
+    skip_headers = {'cookie', 'content-length', 'host'}
+    headers = {
+        name: value for name, value in record.get('headers', {}).items()
+        if not name.startswith(':') and name.lower() not in skip_headers
+    }
+    
+    with requests.Session() as session:
+        for cookie in record.get('cookies', []):
+            session.cookies.set(cookie['name'], cookie['value'],
+                                domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+        
+        with session.request(record['method'], url, data=body, headers=headers, timeout=timeout,
+                             stream=True) as response:
+            response.raise_for_status()
+            # Hash the body as it streams in
+            return DownloadedWorkbook(response.iter_content(HASH_CHUNK_SIZE))
+
+async def _replay_fetch(date_str, report_code=GILTS_REPORT_CODE, limiter=None, strict_date=False):
+    """
+    Fetch the Excel file by replaying the recorded export request.
+    
+    Args:
+        date_str (str): Date in format 'DD/MM/YYYY'.
+        report_code (str): DMO report to fetch.
+        limiter (AdaptiveLimiter, optional): Limit on concurrent requests to DMO.
+        strict_date (bool): Also reject a workbook whose title gives a different as-of date.
+    
+    Returns:
+        bytes: Contents of the file, or None if there is no record, the record cannot
+        be replayed for date_str or the replay did not return a workbook
+    """
+    record = _load_export_request(report_code)
+    if record is None:
+        print(f"No recorded {report_code} export request yet, using the browser")
+        return None
+    
+    print(f"Replaying {report_code} export request for {date_str}...")
+    try:
+        data = await _limited(limiter, lambda: asyncio.to_thread(_replay_export_request, record, date_str))
+    except requests.RequestException as e:
+        print(f"Export request replay failed: {e}")
+        return None
+    
+    if data is None:
+        return None
+    if not _is_workbook(data):
+        # Usually an HTML page, e.g. expired cookies or a bot challenge
+        print(f"{report_code} export request replay did not return an Excel workbook")
+        return None
+    if strict_date:
+        try:
+            as_of = _title_as_of(_workbook_title(data))
+        except Exception as e:
+            print(f"{report_code} export request replay returned an unreadable workbook: {e}")
+            return None
+        if as_of and as_of != date_str:
+            print(f"{report_code} export request replay returned data as at {as_of}, not {date_str}")
+            return None
+    return data
+
+async def _measure_page_load(context, url):
+    """Load a page and report the time to network idle and the bytes transferred."""
+    finished = []
+    page = await context.new_page()
+    page.on('requestfinished', finished.append)
+    try:
+        start = time.monotonic()
+        await page.goto(url, wait_until='networkidle', timeout=60000)
+        seconds = time.monotonic() - start
+        
+        transferred = 0
+        for request in finished:
+            sizes = await request.sizes()
+            transferred += sizes['responseHeadersSize'] + sizes['responseBodySize']
+        return {'seconds': seconds, 'bytes': transferred, 'requests': len(finished)}
+    finally:
+        await _close_quietly(page)
+
+async def measure_resource_blocking(profile=None, url=GILTS_REPORT_URL, headless=True):
+    """
+    Load the report page with and without resource blocking and compare them.
+    
+    Each load uses a fresh context so that nothing is served from cache.
+    
+    Args:
+        profile (ResourceBlockingProfile, optional): Profile to measure. Defaults to
+            ResourceBlockingProfile().
+        url (str): Page to load.
+        headless (bool): Whether to run the browser in headless mode.
+    
+    Returns:
+        dict: Timings and byte counts for both loads plus the bytes and seconds saved
+    """
+    if profile is None:
+        profile = ResourceBlockingProfile()
+    
+    async with BrowserPool(size=1, headless=headless) as pool:
+        await pool.start()
+        
+        print(f"Loading {url} without resource blocking...")
+        context = await _new_context(pool._browser)
+        try:
+            unblocked = await _measure_page_load(context, url)
+        finally:
+            await _close_quietly(context)
+        
+        print(f"Loading {url} with resource blocking...")
+        context = await _new_context(pool._browser, profile)
+        try:
+            blocked = await _measure_page_load(context, url)
+        finally:
+            await _close_quietly(context)
+    
+    blocked['aborted'] = profile.aborted
+    report = {
+        'unblocked': unblocked,
+        'blocked': blocked,
+        'bytes_saved': unblocked['bytes'] - blocked['bytes'],
+        'seconds_saved': unblocked['seconds'] - blocked['seconds']
+    }
+    print(f"Without blocking: {unblocked['seconds']:.2f}s, {unblocked['bytes']} bytes in {unblocked['requests']} requests")
+    print(f"With blocking:    {blocked['seconds']:.2f}s, {blocked['bytes']} bytes in {blocked['requests']} requests "
+          f"({profile.aborted} aborted)")
+    print(f"Saved {report['bytes_saved']} bytes and {report['seconds_saved']:.2f}s")
+    return report
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+async def _benchmark_cycle(pool, date_str, base_url, fast):
+    """Time one download on a pool, including the browser launch if the pool is not started yet."""
+    timings = {}
+    started = time.monotonic()
+    await pool.start()
+    timings['launch'] = time.monotonic() - started
+    async with pool.context() as context:
+        page = await context.new_page()
+        try:
+            data = await _download_on_page(page, date_str, fast=fast, base_url=base_url, timings=timings)
+        finally:
+            await _close_quietly(page)
+    timings['total'] = time.monotonic() - started
+    return timings if data and _is_workbook(data) else None
+
+async def benchmark_engines(engines=BROWSER_ENGINES, cycles=5, base_url=DMO_REPORT_URL, headless=True,
+                            date_str=None, fast=True):
+    """
+    Time cold and warm download cycles for each browser engine.
+    
+    A cold cycle launches a new browser for one download and closes it again. Warm
+    cycles reuse one running browser, so their launch time is zero. Point base_url at
+    the local stand-in (see dmo_standin_server.py) to compare engines without load on DMO.
+    
+    Args:
+        engines (list): Engines to compare, from BROWSER_ENGINES.
+        cycles (int): Cold and warm downloads per engine.
+        base_url (str): Report page URL without the query string.
+        headless (bool): Whether to run the browsers in headless mode.
+        date_str (str, optional): Date to download. If None, yesterday's date is used.
+        fast (bool): Use the latency-optimised browser flow (see download_gilts_data).
+    
+    Returns:
+        dict: Engine mapped to {'cold': ..., 'warm': ...}, each holding the p50, p90 and
+        max seconds for launch, navigation, click_to_download and total, plus the
+        number of failed cycles
+    """
+    date_str = date_str or _default_date()
+    steps = ('launch', 'navigation', 'click_to_download', 'total')
+    report = {}
+    
+    for engine in engines:
+        print(f"\n=== BENCHMARKING {engine.upper()} ({cycles} cold, {cycles} warm) ===\n")
+        runs = {'cold': [], 'warm': []}
+        try:
+            for _ in range(cycles):
+                async with BrowserPool(size=1, headless=headless, engine=engine) as pool:
+                    runs['cold'].append(await _benchmark_cycle(pool, date_str, base_url, fast))
+            async with BrowserPool(size=1, headless=headless, engine=engine) as pool:
+                await pool.start()
+                for _ in range(cycles):
+                    runs['warm'].append(await _benchmark_cycle(pool, date_str, base_url, fast))
+        except Exception as e:
+            print(f"Could not benchmark {engine}: {e}")
+            report[engine] = {'error': str(e)}
+            continue
+        
+        report[engine] = {}
+        for mode, timings in runs.items():
+            completed = [t for t in timings if t]
+            summary = {'failed': len(timings) - len(completed)}
+            for step in steps:
+                values = [t[step] for t in completed if step in t]
+                summary[step] = {'p50': _percentile(values, 50), 'p90': _percentile(values, 90),
+                                 'max': max(values) if values else None}
+            report[engine][mode] = summary
+    
+    print(f"\n{'engine':<10}{'mode':<6}{'step':<19}{'p50':>8}{'p90':>8}{'max':>8}")
+    for engine, modes in report.items():
+        if 'error' in modes:
+            print(f"{engine:<10}failed: {modes['error']}")
+            continue
+        for mode, summary in modes.items():
+            for step in steps:
+                cells = ''.join(f"{value:>8.2f}" if value is not None else f"{'-':>8}"
+                                for value in summary[step].values())
+                print(f"{engine:<10}{mode:<6}{step:<19}{cells}")
+            if summary['failed']:
+                print(f"{engine:<10}{mode:<6}{summary['failed']} of {cycles} cycles failed")
+    return report
+
+class SelectorCache:
+    """
+    On-disk record of which selector found each page control, per report code.
+    
+    The learned selector is tried first on the next run. If it stops matching,
+    discovery falls through to the remaining selectors and whichever matches
+    instead is learned.
+    
+    Args:
+        path (str): JSON file the cache is kept in.
+    """
+    
+    def __init__(self, path=SELECTOR_CACHE_FILE):
+        self.path = path
+        self._entries = self._load()
+    
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Error reading selector cache, starting afresh: {e}")
+            return {}
+    
+    def ordered(self, report_code, name, selectors):
+        """
+        Order selectors for a lookup, with the learned one first.
+        
+        Args:
+            report_code (str): DMO report code, e.g. 'D1A'.
+            name (str): Control name, e.g. 'excel'.
+            selectors (list): Candidate selectors in their default order.
+        
+        Returns:
+            list: The same selectors, learned one first
+        """
+        learned = self._entries.get(report_code, {}).get(name)
+        if learned not in selectors:
+            return list(selectors)
+        return [learned] + [selector for selector in selectors if selector != learned]
+    
+    def learn(self, report_code, name, selector):
+        """Record the selector that matched a control, saving the cache if it changed."""
+        learned = self._entries.setdefault(report_code, {})
+        if learned.get(name) != selector:
+            learned[name] = selector
+            self.save()
+    
+    def save(self):
+        """Write the cache to disk."""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving selector cache: {e}")
+
+_selector_cache = None
+
+def _shared_selector_cache():
+    """The SelectorCache shared by all downloads in this process."""
+    global _selector_cache
+    if _selector_cache is None:
+        _selector_cache = SelectorCache()
+    return _selector_cache
+
+def _split_selector(selector):
+    """Split a Playwright selector into its CSS part and optional :has-text() text."""
+    match = HAS_TEXT_PATTERN.match(selector)
+    if match:
+        return [match.group(1), match.group(3)]
+    return [selector, None]
+
+async def _discover_controls(page, groups):
+    """
+    Find several page controls with a single in-page evaluate call.
+    
+    For each group the selectors are tried in order, like successive
+    page.query_selector calls, and the first matching element is tagged so a
+    locator can point at it without another lookup.
+    
+    Args:
+        page: Playwright page to search.
+        groups (dict): Control name mapped to its list of selectors.
+    
+    Returns:
+        dict: Control name mapped to None if nothing matched, otherwise a dict with the
+        'locator' for the element, the 'selector' that matched and the element 'type'
+    """
+    found = await page.evaluate(DISCOVERY_SCRIPT, {
+        name: [_split_selector(selector) for selector in selectors]
+        for name, selectors in groups.items()
+    })
+    
+    controls = {}
+    for name, selectors in groups.items():
+        match = found.get(name)
+        if match is None:
+            controls[name] = None
+        else:
+            controls[name] = {
+                'locator': page.locator(f'[data-gilts-control="{name}"]'),
+                'selector': selectors[match['index']],
+                'type': match['type']
+            }
+    return controls
+
+async def _dump_page_controls(page):
+    """Print every input and button on the page, to help update the selectors."""
+    form_elements = await page.evaluate("""
+        () => {
+            const inputs = Array.from(document.querySelectorAll('input'));
+            return inputs.map(input => ({
+                id: input.id,
+                name: input.name,
+                type: input.type,
+                placeholder: input.placeholder
+            }));
+        }
+    """)
+    print(f"Found form elements: {form_elements}")
+    
+    buttons = await page.evaluate("""
+        () => {
+            const buttons = Array.from(document.querySelectorAll('button, input[type="button"], a.button, .btn'));
+            return buttons.map(button => ({
+                text: button.innerText || button.value,
+                id: button.id,
+                class: button.className
+            }));
+        }
+    """)
+    print(f"Found buttons: {buttons}")
+
+async def _set_report_date(date_input, date_str, budget=None):
+    """
+    Fill the report date input on the DMO page.
+    
+    Args:
+        date_input (dict): The 'date' control found by _discover_controls, or None.
+        date_str (str): Date in format 'DD/MM/YYYY'.
+        budget (TimeBudget, optional): Time limits for the steps. Defaults to TimeBudget().
+    
+    Returns:
+        bool: True if a date input was found and filled. False if it was missing or
+        could not be filled (e.g. readonly or driven by a datepicker); the caller
+        decides whether to carry on with the page's default date.
+    """
+    if not date_input:
+        print("Could not find date input, using default date...")
+        return False
+    if budget is None:
+        budget = TimeBudget()
+    
+    # Native date inputs only accept ISO dates
+    value = date_str
+    if date_input['type'] == 'date':
+        value = datetime.strptime(date_str, '%d/%m/%Y').strftime('%Y-%m-%d')
+    try:
+        await date_input['locator'].fill(value, timeout=budget.timeout_ms('date'))
+        await date_input['locator'].dispatch_event('change', timeout=budget.timeout_ms('date'))
+    except Exception as e:
+        print(f"Could not fill date input {date_input['selector']}, using default date: {e}")
+        return False
+    print(f"Set report date to {value} using {date_input['selector']}")
+    return True
+
+def _date_range(start_date, end_date, skip_weekends=True):
+    """
+    List the dates between start_date and end_date inclusive.
+    
+    Args:
+        start_date (str): First date in format 'DD/MM/YYYY'.
+        end_date (str): Last date in format 'DD/MM/YYYY'.
+        skip_weekends (bool): Leave out Saturdays and Sundays, when DMO does not publish.
+    
+    Returns:
+        list: Dates in format 'DD/MM/YYYY'
+    """
+    current = datetime.strptime(start_date, '%d/%m/%Y')
+    last = datetime.strptime(end_date, '%d/%m/%Y')
+    if current > last:
+        raise ValueError(f"Start date {start_date} is after end date {end_date}")
+    
+    dates = []
+    while current <= last:
+        if not (skip_weekends and current.weekday() >= 5):
+            dates.append(current.strftime('%d/%m/%Y'))
+        current += timedelta(days=1)
+    return dates
+
+class BackfillJournal:
+    """
+    Append-only record of each backfill job's progress, so an interrupted run can resume.
+    
+    Every state change of a (report code, date) job is appended as one JSON line:
+    pending, downloaded, converted or failed (with a reason). Reading the journal
+    back keeps the last line for each job.
+    
+    Args:
+        path (str, optional): JSON Lines file to append to. If None, states are only kept in memory.
+    """
+    
+    PENDING = 'pending'
+    DOWNLOADED = 'downloaded'
+    CONVERTED = 'converted'
+    FAILED = 'failed'
+    
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.jobs = self._load()
+    
+    def _load(self):
+        jobs = {}
+        if self.path is None:
+            return jobs
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        jobs[(entry['report'], entry['date'])] = entry
+                    except (ValueError, KeyError):
+                        # A run killed mid-write can leave a partial last line
+                        continue
+        except FileNotFoundError:
+            pass
+        return jobs
+    
+    def record(self, report_code, date_str, state, **details):
+        """
+        Append a job's new state.
+        
+        Args:
+            report_code (str): DMO report code of the job.
+            date_str (str): Date of the job in format 'DD/MM/YYYY'.
+            state (str): One of PENDING, DOWNLOADED, CONVERTED or FAILED.
+            **details: Extra fields to keep with the state, such as file, attempt or reason.
+        """
+        self.record_many(report_code, [date_str], state, **details)
+    
+    def record_many(self, report_code, date_strs, state, **details):
+        """
+        Append the same new state for several jobs with a single write and sync.
+        
+        Args:
+            report_code (str): DMO report code of the jobs.
+            date_strs (list): Dates of the jobs in format 'DD/MM/YYYY'.
+            state (str): One of PENDING, DOWNLOADED, CONVERTED or FAILED.
+            **details: Extra fields to keep with each state.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        entries = []
+        for date_str in date_strs:
+            entry = {'report': report_code, 'date': date_str, 'state': state, 'time': now}
+            entry.update(details)
+            entries.append(entry)
+        if not entries:
+            return
+        with self._lock:
+            if self.path is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+            for entry in entries:
+                self.jobs[(report_code, entry['date'])] = entry
+    
+    def state(self, report_code, date_str):
+        """Last recorded state of a job, or None if it has never been seen."""
+        entry = self.jobs.get((report_code, date_str))
+        return entry['state'] if entry else None
+    
+    def downloaded_file(self, report_code, date_str):
+        """File a job downloaded, if it is downloaded or converted and the file still exists."""
+        entry = self.jobs.get((report_code, date_str))
+        if entry and entry['state'] in (self.DOWNLOADED, self.CONVERTED):
+            if entry.get('file') and os.path.exists(entry['file']):
+                return entry['file']
+        return None
+
+async def _fetch_with_retries(fetch, date_str, journal, report_code=GILTS_REPORT_CODE,
+                              retries=3, backoff=2.0):
+    """
+    Run one backfill download, retrying with exponential backoff and journalling each attempt.
+    
+    Args:
+        fetch: Coroutine function taking the date and returning the saved file path or None.
+        date_str (str): Date to download in format 'DD/MM/YYYY'.
+        journal (BackfillJournal): Journal to record the job's progress in.
+        report_code (str): DMO report code of the job.
+        retries (int): Attempts made after the first one fails.
+        backoff (float): Seconds to wait before the first retry; doubled after each one.
+    
+    Returns:
+        str: Path to the downloaded file, or None if every attempt failed
+    """
+    for attempt in range(1, retries + 2):
+        try:
+            path = await fetch(date_str)
+            reason = "no workbook was downloaded"
+        except Exception as e:
+            path = None
+            reason = f"{type(e).__name__}: {e}"
+        
+        if path and not _is_workbook_file(path):
+            # Usually an HTML bot challenge saved in place of the workbook
+            os.remove(path)
+            path = None
+            reason = "challenge page"
+        
+        if path:
+            journal.record(report_code, date_str, BackfillJournal.DOWNLOADED, file=path, attempt=attempt)
+            return path
+        
+        journal.record(report_code, date_str, BackfillJournal.FAILED, reason=reason, attempt=attempt)
+        if attempt <= retries:
+            # Back off exponentially, with jitter so retries of different dates do not line up
+            delay = backoff * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+            print(f"{date_str}: attempt {attempt} failed ({reason}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    return None
+
+async def backfill_gilts_data(start_date, end_date, concurrency=3, skip_weekends=True, pool=None,
+                              replay=False, fast=False, time_budget=None, journal=None,
+                              retries=3, backoff=2.0, limiter=None, slow_response=20.0, cooldown=30.0):
+    """
+    Download Gilts in Issue data for every date in a range, several dates at a time.
+    
+    Each date is fetched on its own page with the date input filled in, using up to
+    `concurrency` browser contexts at once. Requests to DMO go through an
+    AdaptiveLimiter, which starts lower and only rises to `concurrency` while
+    DMO keeps answering quickly with workbooks.
+    
+    Args:
+        start_date (str): First date in format 'DD/MM/YYYY'.
+        end_date (str): Last date in format 'DD/MM/YYYY' (inclusive).
+        concurrency (int): Maximum number of dates fetched at the same time.
+        skip_weekends (bool): Do not fetch Saturdays and Sundays.
+        pool (BrowserPool, optional): Pool to borrow contexts from. If None, a pool of
+            `concurrency` contexts is created for the backfill.
+        replay (bool): Replay the recorded export request over HTTP where possible
+            (see download_gilts_data).
+        fast (bool): Use the latency-optimised browser flow (see download_gilts_data).
+        time_budget (float, optional): Overall limit in seconds for each date's browser download.
+        journal (BackfillJournal, optional): Journal of finished work. Dates it records as
+            downloaded or converted are not fetched again. If None, nothing is skipped or recorded.
+        retries (int): Attempts made after a date's first download fails.
+        backoff (float): Seconds to wait before a date's first retry; doubled after each one.
+        limiter (AdaptiveLimiter, optional): Limit on concurrent requests to DMO. If None,
+            one is created with `concurrency` as its maximum.
+        slow_response (float): Seconds an export may take before the limiter created
+            here counts it as slow.
+        cooldown (float): Seconds the limiter created here pauses after a challenge page.
+    
+    Returns:
+        dict: Date string mapped to the downloaded file path, or None if that date failed
+    """
+    all_dates = _date_range(start_date, end_date, skip_weekends)
+    if journal is None:
+        journal = BackfillJournal(path=None)
+    
+    # Resume: dates already downloaded in an earlier run keep their file
+    done = {date_str: journal.downloaded_file(GILTS_REPORT_CODE, date_str) for date_str in all_dates}
+    done = {date_str: path for date_str, path in done.items() if path}
+    dates = [date_str for date_str in all_dates if date_str not in done]
+    journal.record_many(GILTS_REPORT_CODE,
+                        [date_str for date_str in dates if journal.state(GILTS_REPORT_CODE, date_str) is None],
+                        BackfillJournal.PENDING)
+    print(f"Backfilling {len(dates)} dates from {start_date} to {end_date} ({concurrency} at a time)"
+          + (f", {len(done)} already done" if done else ""))
+    
+    own_pool = pool is None
+    if own_pool:
+        pool = BrowserPool(size=concurrency)
+    limit = asyncio.Semaphore(concurrency)
+    if limiter is None:
+        limiter = AdaptiveLimiter(initial=min(2, concurrency), maximum=concurrency,
+                                  slow_response=slow_response, cooldown=cooldown)
+    
+    async def download(date_str):
+        # Each attempt takes its own slot, so a date backing off leaves it to the others
+        async with limit:
+            return await download_gilts_data(date_str, pool=pool, strict_date=True, replay=replay,
+                                             fast=fast, time_budget=time_budget, limiter=limiter)
+    
+    async def fetch(date_str):
+        return await _fetch_with_retries(download, date_str, journal, retries=retries, backoff=backoff)
+    
+    try:
+        paths = []
+        if replay and dates and _load_export_request() is None:
+            # Fetch one date through the browser first so the rest can be replayed
+            paths.append(await fetch(dates[0]))
+        paths += await asyncio.gather(*(fetch(date_str) for date_str in dates[len(paths):]))
+    finally:
+        if own_pool:
+            await pool.close()
+    
+    fetched = dict(zip(dates, paths))
+    failed = [date_str for date_str, path in fetched.items() if not path]
+    print(f"Backfill finished: {len(dates) - len(failed)} downloaded, {len(failed)} failed")
+    if failed:
+        print(f"Failed dates: {', '.join(failed)}")
+    if limiter.challenges:
+        print(f"DMO served {limiter.challenges} challenge pages; ended at {limiter.limit} concurrent requests")
+    return {date_str: done.get(date_str) or fetched.get(date_str) for date_str in all_dates}
+
+def _csv_path(output_dir, excel_file=None, date_str=None, prefix='gilts_in_issue'):
+    """
+    Path of the CSV file for a workbook, named <prefix>_YYYYMMDD.csv after its date.
+    
+    The date is date_str ('DD/MM/YYYY') if given, otherwise it is taken from the
+    Excel file name (gilts_in_issue_DD-MM-YYYY.xls), falling back to today.
+    """
+    # Extract date from filename or use current date
+    try:
+        if date_str:
+            date_obj = datetime.strptime(date_str, '%d/%m/%Y')
+        else:
+            # Try to extract date from filename (format: gilts_in_issue_DD-MM-YYYY.xls)
+            filename = os.path.basename(excel_file)
+            file_date = filename.split('_')[-1].split('.')[0]  # Extract DD-MM-YYYY
+            date_obj = datetime.strptime(file_date, '%d-%m-%Y')
+        formatted_date = date_obj.strftime('%Y%m%d')
+    except (ValueError, IndexError, TypeError):
+        # If date extraction fails, use current date
+        formatted_date = datetime.now().strftime('%Y%m%d')
+    
+    return os.path.join(output_dir, f"{prefix}_{formatted_date}.csv")
+
+def _default_csv_dir():
+    """The csv_exports directory next to this script."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csv_exports')
+
+class XlrdSheetReader:
     """
-    Download Gilts in Issue data from the UK Debt Management Office website using Playwright.
+    Row reader for the first sheet of a .xls (BIFF) workbook, using xlrd.
+    
+    The workbook is opened on demand so only the first sheet is parsed, and
+    formatting records are skipped.
     
     Args:
-        date_str (str, optional): Date in format 'DD/MM/YYYY'. If None, yesterday's date is used.
+        excel_file (str, optional): Path to the Excel file (memory-mapped by xlrd).
+        file_contents (bytes, optional): Contents of the Excel file, instead of excel_file.
+    """
+    
+    def __init__(self, excel_file=None, file_contents=None):
+        if file_contents is not None:
+            self.workbook = xlrd.open_workbook(file_contents=file_contents, on_demand=True, formatting_info=False)
+        else:
+            self.workbook = xlrd.open_workbook(excel_file, on_demand=True, formatting_info=False)
+        self.sheet = self.workbook.sheet_by_index(0)
+        self.nsheets = self.workbook.nsheets
+        self.nrows = self.sheet.nrows
+        self.ncols = self.sheet.ncols
+        self.datemode = self.workbook.datemode
+    
+    def rows(self):
+        """Yield each row's raw values: strings, floats (dates as Excel serials) and '' for blanks."""
+        for i in range(self.sheet.nrows):
+            yield self.sheet.row_values(i)
+    
+    def close(self):
+        """Unload the sheet and release the workbook's buffers."""
+        self.workbook.unload_sheet(0)
+        self.workbook.release_resources()
+
+class OpenpyxlSheetReader:
+    """
+    Row reader for the first sheet of a .xlsx (OOXML) workbook, using openpyxl's read-only mode.
+    
+    Rows are streamed from the sheet XML, so memory use does not grow with the
+    sheet. Values are normalised to what xlrd returns for the same cells, so
+    both readers feed the converter identical rows.
+    
+    Args:
+        excel_file (str, optional): Path to the Excel file.
+        file_contents (bytes, optional): Contents of the Excel file, instead of excel_file.
+    """
+    
+    def __init__(self, excel_file=None, file_contents=None):
+        # openpyxl is only needed for .xlsx files
+        import openpyxl
+        from openpyxl.utils.datetime import to_excel, CALENDAR_MAC_1904
+        
+        self._to_excel = to_excel
+        source = io.BytesIO(file_contents) if file_contents is not None else excel_file
+        self.workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        self.sheet = self.workbook.worksheets[0]
+        self.nsheets = len(self.workbook.worksheets)
+        self.nrows = self.sheet.max_row or 0
+        self.ncols = self.sheet.max_column or 0
+        self.epoch = self.workbook.epoch
+        self.datemode = 1 if self.epoch == CALENDAR_MAC_1904 else 0
+    
+    def _value(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            # xlrd gives booleans as 0 or 1
+            return int(value)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, (datetime, date_type, dt_time, timedelta)):
+            return float(self._to_excel(value, self.epoch))
+        return value
+    
+    def rows(self):
+        """Yield each row's raw values, converted to xlrd's types and padded to the sheet width."""
+        for values in self.sheet.iter_rows(values_only=True):
+            row = [self._value(value) for value in values]
+            if len(row) < self.ncols:
+                row += [''] * (self.ncols - len(row))
+            yield row
+    
+    def close(self):
+        """Close the workbook and the file it streams from."""
+        self.workbook.close()
+
+@contextmanager
+def _first_sheet(excel_file=None, file_contents=None):
+    """
+    Open the first sheet of a workbook with the reader for its format.
+    
+    .xls files are read with xlrd and .xlsx files are streamed with openpyxl; the
+    format is taken from the file's leading bytes, not its name. The reader is
+    closed when the with block ends, so a worker converting many files holds at
+    most one sheet at a time.
+    
+    Args:
+        excel_file (str, optional): Path to the Excel file.
+        file_contents (bytes, optional): Contents of the Excel file, instead of excel_file.
+    
+    Yields:
+        XlrdSheetReader or OpenpyxlSheetReader: Reader with nsheets, nrows, ncols,
+        datemode and a rows() generator
+    """
+    if file_contents is not None:
+        signature = file_contents[:len(ZIP_SIGNATURE)]
+    else:
+        with open(excel_file, 'rb') as f:
+            signature = f.read(len(ZIP_SIGNATURE))
+    
+    if signature == ZIP_SIGNATURE:
+        reader = OpenpyxlSheetReader(excel_file, file_contents)
+    else:
+        reader = XlrdSheetReader(excel_file, file_contents)
+    try:
+        yield reader
+    finally:
+        reader.close()
+
+def _is_header_row(row_values):
+    """Check if a row contains the typical Gilts in Issue column headers."""
+    return 'ISIN Code' in row_values and 'Redemption Date' in row_values
+
+def _row_kind(index, raw_row, row_values, header_row_idx, isin_column=1):
+    """
+    Classify a row below the header row.
     
     Returns:
-        str: Path to the downloaded file
+        str: 'empty', 'group' (Ultra-Short, Short, Medium, Long), 'section' (e.g.
+        Index-linked Gilts), 'note' (other text in the first column only) or 'data'
+    """
+    if not any(row_values):
+        return 'empty'
+    if row_values[0] in GROUP_LABELS:
+        return 'group'
+    # Rows with content in the first column but no ISIN code
+    if row_values[0] and not (len(raw_row) > isin_column and raw_row[isin_column]) and index > header_row_idx + 1:
+        if 'Gilts' in row_values[0] or 'Index-linked' in row_values[0]:
+            return 'section'
+        return 'note'
+    return 'data'
+
+def _classify_rows(rows):
     """
-    # Base URL for the Gilts in Issue data
-    base_url = "https://www.dmo.gov.uk/data/pdfdatareport?reportCode=D1A"
+    Classify the rows of a Gilts in Issue sheet in one pass, in CSV output order.
     
-    # If no date provided, use yesterday's date
-    if not date_str:
-        yesterday = datetime.now() - timedelta(days=1)
-        date_str = yesterday.strftime('%d/%m/%Y')
+    The title row (row 1) and total row (row 6) are held back until the header
+    row has been found in the first HEADER_SCAN_ROWS rows; every row after the
+    header is then classified and yielded as soon as it is read.
     
-    print(f"Attempting to download Gilts data for date: {date_str}")
+    Args:
+        rows: Iterable of raw row values, as yielded by a sheet reader's rows().
     
-    # Create output directory if it doesn't exist
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(script_dir, "downloads")
-    os.makedirs(output_dir, exist_ok=True)
+    Yields:
+        tuple: (kind, row index, stripped string values, raw values), where kind is
+        'title', 'total', 'header' or one of the kinds returned by _row_kind
     
-    async with async_playwright() as p:
-        # Launch a browser with a realistic viewport and user agent
-        browser_type = p.chromium  # Can also use p.firefox or p.webkit
-        
-        # Use a browser context with options to appear more human-like
-        browser = await browser_type.launch(headless=False)  # Set to True for headless mode
-        
-        # Create a context with specific options
-        context = await browser.new_context(
-            viewport={'width': 1280, 'height': 800},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-            accept_downloads=True,
-            locale='en-GB',
-            timezone_id='Europe/London'
-        )
-        
-        # Add some human-like behaviors
-        # 1. Enable JavaScript and cookies
-        await context.add_cookies([{
-            'name': 'user_preference',
-            'value': 'accepted',
-            'domain': 'www.dmo.gov.uk',
-            'path': '/'
-        }])
-        
-        # Create a new page
-        page = await context.new_page()
+    Raises:
+        ValueError: If the header row or total row cannot be found
+    """
+    title = total = header = None  # (stripped, raw) values
+    header_row_idx = None
+    isin_column = None
+    pending = []
+    started = False
+    for index, raw_row in enumerate(rows):
+        row_values = [str(value).strip() for value in raw_row]
+        if index == 0:
+            title = (row_values, raw_row)
+        if index == TOTAL_ROW_INDEX:
+            total = (row_values, raw_row)
         
-        try:
-            # Navigate to the DMO website with a timeout
-            print("Navigating to DMO website...")
-            await page.goto(base_url, wait_until='networkidle', timeout=60000)
-            
-            # Add a random delay to mimic human behavior
-            await asyncio.sleep(random.uniform(1.5, 3.0))
-            
-            # Handle cookie popup if it appears
-            print("Checking for cookie popup...")
-            try:
-                # Look for common cookie consent buttons
-                cookie_selectors = [
-                    "button:has-text('Accept')", 
-                    "button:has-text('Accept All')",
-                    "button:has-text('Accept Cookies')",
-                    "button:has-text('I Accept')",
-                    "button:has-text('OK')",
-                    "button:has-text('Agree')",
-                    "#onetrust-accept-btn-handler",
-                    ".cookie-accept-button",
-                    ".accept-cookies"
-                ]
-                
-                for selector in cookie_selectors:
-                    cookie_button = await page.query_selector(selector)
-                    if cookie_button:
-                        print(f"Found cookie popup, clicking {selector}...")
-                        await cookie_button.click()
-                        print("Accepted cookies")
-                        # Wait for popup to disappear
-                        await asyncio.sleep(random.uniform(1.0, 2.0))
-                        break
-            except Exception as e:
-                print(f"Error handling cookie popup: {e}")
-            
-            # Identify form elements on the page
-            print("Analyzing page elements...")
-            form_elements = await page.evaluate("""
-                () => {
-                    const inputs = Array.from(document.querySelectorAll('input'));
-                    return inputs.map(input => ({
-                        id: input.id,
-                        name: input.name,
-                        type: input.type,
-                        placeholder: input.placeholder
-                    }));
-                }
-            """)
-            print(f"Found form elements: {form_elements}")
-            
-            # Skip setting the date as it's correct by default
-            print("Using default date...")
-            
-            # Add a random delay to mimic human behavior
-            await asyncio.sleep(random.uniform(1.0, 2.0))
-            
-            # Set up download handler
-            download_path = None
-            
-            async def handle_download(download):
-                nonlocal download_path
-                print("Download started...")
-                # Wait for the download to complete
-                download_path = await download.path()
-                print(f"Download completed: {download_path}")
-            
-            # Listen for download events
-            page.on('download', handle_download)
-            
-            # Find all buttons on the page
-            print("Finding Excel button...")
-            buttons = await page.evaluate("""
-                () => {
-                    const buttons = Array.from(document.querySelectorAll('button, input[type="button"], a.button, .btn'));
-                    return buttons.map(button => ({
-                        text: button.innerText || button.value,
-                        id: button.id,
-                        class: button.className
-                    }));
-                }
-            """)
-            print(f"Found buttons: {buttons}")
-                
-            # Find and click the Excel button
-            print("Clicking Excel button...")
-            excel_button = await page.query_selector('button:has-text("Excel")')
-            
-            if not excel_button:
-                print("Trying alternative Excel button selectors...")
-                excel_selectors = [
-                    'input[value*="Excel"]',
-                    'a:has-text("Excel")',
-                    '.btn:has-text("Excel")',
-                    'button[id*="excel"]',
-                    'button[class*="excel"]'
-                ]
-                
-                for selector in excel_selectors:
-                    print(f"Trying Excel button selector: {selector}")
-                    excel_button = await page.query_selector(selector)
-                    if excel_button:
-                        print(f"Found Excel button with selector: {selector}")
-                        break
-                
-            if excel_button:
-                # Click the button directly - no need for human-like motion
-                
-                # Click the button
-                await excel_button.click()
-                print("Clicked Excel button")
-                
-                # Wait for download to start and complete
-                print("Waiting for download to complete...")
-                # Wait up to 30 seconds for the download to complete
-                download_wait_time = 0
-                while download_path is None and download_wait_time < 30:
-                    await asyncio.sleep(1)
-                    download_wait_time += 1
-                
-                if download_path:
-                    # Copy the file to our downloads directory with proper naming
-                    file_date = date_str.replace('/', '-')
-                    output_file = os.path.join(output_dir, f"gilts_in_issue_{file_date}.xls")
-                    
-                    # If the file exists, remove it first
-                    if os.path.exists(output_file):
-                        os.remove(output_file)
-                    
-                    # Copy the downloaded file
-                    os.rename(download_path, output_file)
-                    print(f"Successfully downloaded Gilts data to: {output_file}")
-                    return output_file
-                else:
-                    print("Download failed or timed out")
-            else:
-                print("Could not find Excel button")
+        if header_row_idx is None:
+            if _is_header_row(row_values):
+                header_row_idx = index
+                header = (row_values, raw_row)
+                isin_column = row_values.index('ISIN Code')
+            elif index + 1 >= HEADER_SCAN_ROWS:
+                break
+        else:
+            kind = _row_kind(index, raw_row, row_values, header_row_idx, isin_column)
+            pending.append((kind, index, row_values, raw_row))
         
-        except Exception as e:
-            print(f"Error during download: {e}")
-        finally:
-            # Close the browser
-            await browser.close()
+        # Everything after the header waits only until the total row has been read
+        if header_row_idx is not None and total is not None:
+            if not started:
+                started = True
+                yield ('title', 0) + title
+                yield ('total', TOTAL_ROW_INDEX) + total
+                yield ('header', header_row_idx) + header
+            yield from pending
+            pending = []
     
-    return None
+    if header_row_idx is None:
+        raise ValueError("Could not find header row in Excel file")
+    if not started:
+        raise ValueError(f"Sheet ends before the total row (row {TOTAL_ROW_INDEX + 1})")
 
-def format_gilts_csv(excel_file=None, output_dir=None):
+def format_gilts_csv(excel_file=None, output_dir=None, file_contents=None, date_str=None):
     """
     Convert Excel file to CSV with proper formatting:
     - Row 1 and 6 of XLS become rows 1 and 2 of CSV
@@ -227,21 +2163,26 @@ def format_gilts_csv(excel_file=None, output_dir=None):
     Args:
         excel_file: Path to the Excel file to convert. If None, will use the latest file in downloads directory.
         output_dir: Directory to save the CSV file. Defaults to 'csv_exports' directory.
+        file_contents: Bytes of the Excel file, to convert a download held in memory
+            instead of reading excel_file from disk.
+        date_str: Date of the data in format 'DD/MM/YYYY', used to name the CSV file.
+            If None, the date is taken from the Excel file name.
     
     Returns:
         Path to the created CSV file or None if conversion failed.
     """
     # Set default output directory
     if output_dir is None:
-        output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csv_exports')
+        output_dir = _default_csv_dir()
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
     # If no file is specified, find the most recent Excel file in the downloads directory
-    if excel_file is None:
+    if excel_file is None and file_contents is None:
         downloads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
-        excel_files = glob.glob(os.path.join(downloads_dir, 'gilts_in_issue_*.xls*'))
+        excel_files = [path for path in glob.glob(os.path.join(downloads_dir, 'gilts_in_issue_*.xls*'))
+                       if not path.endswith('.part')]
         
         if not excel_files:
             print("Error: No Excel files found in the downloads directory.")
@@ -250,98 +2191,55 @@ def format_gilts_csv(excel_file=None, output_dir=None):
         # Get the most recent file
         excel_file = max(excel_files, key=os.path.getmtime)
     
-    # Check if file exists
-    if not os.path.exists(excel_file):
-        print(f"Error: File not found at {excel_file}")
-        return None
-    
-    print(f"Converting file: {excel_file}")
+    if file_contents is not None:
+        print(f"Converting {len(file_contents)} bytes held in memory")
+    else:
+        # Check if file exists
+        if not os.path.exists(excel_file):
+            print(f"Error: File not found at {excel_file}")
+            return None
+        
+        print(f"Converting file: {excel_file}")
     
     try:
-        # Extract date from filename or use current date
-        try:
-            # Try to extract date from filename (format: gilts_in_issue_DD-MM-YYYY.xls)
-            filename = os.path.basename(excel_file)
-            date_str = filename.split('_')[-1].split('.')[0]  # Extract DD-MM-YYYY
-            date_obj = datetime.strptime(date_str, '%d-%m-%Y')
-            formatted_date = date_obj.strftime('%Y%m%d')
-        except (ValueError, IndexError):
-            # If date extraction fails, use current date
-            formatted_date = datetime.now().strftime('%Y%m%d')
-        
         # Create CSV filename with date
-        csv_filename = f"gilts_in_issue_{formatted_date}.csv"
-        csv_path = os.path.join(output_dir, csv_filename)
-        
-        # Open the workbook
-        workbook = xlrd.open_workbook(excel_file)
-        sheet = workbook.sheet_by_index(0)
-        
-        print(f"Excel file has {workbook.nsheets} sheets")
-        print(f"Sheet dimensions: {sheet.nrows} rows, {sheet.ncols} columns")
-        
-        # Find the row with headers (should be row 9 in the Excel file, index 8)
-        header_row_idx = None
-        for i in range(min(15, sheet.nrows)):  # Look in first 15 rows
-            row_values = [str(sheet.cell_value(i, j)).strip() for j in range(sheet.ncols)]
-            # Check if this row contains typical headers
-            if 'ISIN Code' in row_values and 'Redemption Date' in row_values:
-                header_row_idx = i
-                print(f"Found header row at index {i} (row {i+1} in Excel)")
-                break
-        
-        if header_row_idx is None:
-            print("Error: Could not find header row in Excel file")
-            return None
+        csv_path = _csv_path(output_dir, excel_file, date_str)
         
-        # Identify section headers
-        section_headers = []
-        for i in range(header_row_idx + 1, sheet.nrows):
-            cell_value = str(sheet.cell_value(i, 0)).strip()
-            
-            # Skip group labels (Ultra-Short, Short, Medium, Long)
-            if cell_value in ['Ultra-Short', 'Short', 'Medium', 'Long']:
-                continue
-            
-            # Check if this might be a section header
-            # Look for rows with content in first column but no ISIN code in second column
-            # Or rows that contain "Index-linked" which indicate a new section
-            if (cell_value and not sheet.cell_value(i, 1) and i > header_row_idx + 1) or \
-               ('Index-linked' in cell_value and i > header_row_idx + 1):
-                # This is likely a section header
-                section_headers.append(i)
-        
-        print(f"Found section headers at rows: {section_headers}")
-        
-        # Write to CSV
-        with open(csv_path, 'w', newline='') as csvfile:
-            # Use csv.QUOTE_ALL to ensure all fields are quoted
-            writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
-            
-            # Row 1: Title row from Excel
-            writer.writerow([str(sheet.cell_value(0, j)).strip() for j in range(sheet.ncols)])
+        # Only the first sheet is loaded, and it is released once the CSV is written
+        with _first_sheet(excel_file, file_contents) as reader:
+            print(f"Excel file has {reader.nsheets} sheets")
+            print(f"Sheet dimensions: {reader.nrows} rows, {reader.ncols} columns")
             
-            # Row 2: Total amount row from Excel (row 6, index 5)
-            writer.writerow([str(sheet.cell_value(5, j)).strip() for j in range(sheet.ncols)])
-            
-            # Row 3: Headers from Excel
-            headers = [str(sheet.cell_value(header_row_idx, j)).strip() for j in range(sheet.ncols)]
-            writer.writerow(headers)
+            # Classify and write the rows in a single pass over the sheet
+            rows = reader.rows()
+            counts = {}
+            header_row_idx = None
+            section_headers = []
+            temp_path = f"{csv_path}.{os.getpid()}.part"
+            try:
+                with open(temp_path, 'w', newline='') as csvfile:
+                    # Use csv.QUOTE_ALL to ensure all fields are quoted
+                    writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+                    for kind, index, row_values, _ in _classify_rows(rows):
+                        counts[kind] = counts.get(kind, 0) + 1
+                        if kind == 'header':
+                            header_row_idx = index
+                        elif kind == 'section':
+                            section_headers.append(index)
+                        # Empty rows and group labels (Ultra-Short, Short, Medium, Long) are left out
+                        if kind not in ('empty', 'group'):
+                            writer.writerow(row_values)
+                os.replace(temp_path, csv_path)
+            except ValueError as e:
+                print(f"Error: {e}")
+                return None
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
             
-            # Process data rows
-            for i in range(header_row_idx + 1, sheet.nrows):
-                row_values = [str(sheet.cell_value(i, j)).strip() for j in range(sheet.ncols)]
-                
-                # Skip empty rows
-                if not any(row_values):
-                    continue
-                
-                # Skip group label rows (Ultra-Short, Short, Medium, Long)
-                if row_values[0] in ['Ultra-Short', 'Short', 'Medium', 'Long']:
-                    continue
-                
-                # Write all other rows with quoting
-                writer.writerow(row_values)
+            print(f"Found header row at index {header_row_idx} (row {header_row_idx + 1} in Excel)")
+            print(f"Found section headers at rows: {section_headers}")
+            print(f"Wrote {counts.get('data', 0)} gilts and {counts.get('note', 0)} notes")
         
         print(f"Successfully converted to CSV: {csv_path}")
         return csv_path
@@ -351,42 +2249,754 @@ def format_gilts_csv(excel_file=None, output_dir=None):
         traceback.print_exc()
         return None
 
-async def main():
+class GiltRecord:
+    """
+    One gilt from a Gilts in Issue workbook, with typed values.
+    
+    Dates are datetime.date objects, the coupon and amounts are Decimals (amounts
+    in £ million; whole numbers come out without a fractional part), and values
+    missing from the sheet are None.
+    """
+    
+    FIELDS = ('as_of', 'section', 'group', 'name', 'isin', 'coupon', 'redemption_date',
+              'first_issue_date', 'dividend_dates', 'ex_dividend_date', 'amount_in_issue',
+              'amount_including_uplift')
+    
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+    
+    def as_dict(self):
+        """Field name mapped to value, in FIELDS order."""
+        return {field: getattr(self, field) for field in self.FIELDS}
+    
+    def as_row(self):
+        """Values as CSV cells: ISO dates, plain decimals and empty strings for None."""
+        return ['' if value is None else value.isoformat() if hasattr(value, 'isoformat') else str(value)
+                for value in (getattr(self, field) for field in self.FIELDS)]
+    
+    def __repr__(self):
+        return f"GiltRecord({self.isin}, {self.name!r})"
+
+# Header text identifying each typed column; amounts are matched by prefix
+RECORD_COLUMNS = {
+    'isin': 'ISIN Code',
+    'redemption_date': 'Redemption Date',
+    'first_issue_date': 'First Issue Date',
+    'dividend_dates': 'Dividend Dates',
+    'ex_dividend_date': 'Current Ex-dividend Date',
+    'amount_in_issue': 'Total Amount in Issue',
+    'amount_including_uplift': 'Total Amount including Inflation Uplift'
+}
+
+def _record_columns(header):
+    """Map GiltRecord fields to column indices from the stripped header row."""
+    columns = {}
+    for field, text in RECORD_COLUMNS.items():
+        for j, heading in enumerate(header):
+            if heading.startswith(text):
+                columns[field] = j
+                break
+    return columns
+
+def _excel_date(value, datemode):
+    """Excel date serial as a date, or None if the cell is blank or not a serial."""
+    if isinstance(value, float) and value > 0:
+        return xlrd.xldate.xldate_as_datetime(value, datemode).date()
+    return None
+
+def _decimal(value):
+    """Numeric cell as a Decimal, whole numbers without a fractional part, or None."""
+    if isinstance(value, float):
+        return Decimal(int(value)) if value.is_integer() else Decimal(repr(value))
+    return None
+
+def _coupon(name):
+    """Coupon in percent from a gilt name such as '0 1/8% Treasury Gilt 2025', or None."""
+    match = re.match(r'\s*(\d+(?:\.\d+)?)(?:\s+(\d+)/(\d+))?\s*%', name)
+    if not match:
+        return None
+    whole, numerator, denominator = match.groups()
+    coupon = Decimal(whole)
+    if numerator:
+        coupon += Decimal(numerator) / Decimal(denominator)
+    return coupon
+
+def iter_gilt_records(excel_file=None, file_contents=None):
+    """
+    Read the gilts in a Gilts in Issue workbook as typed records.
+    
+    Args:
+        excel_file (str, optional): Path to the Excel file.
+        file_contents (bytes, optional): Contents of the Excel file, instead of excel_file.
+    
+    Yields:
+        GiltRecord: One record per gilt, in sheet order
+    
+    Raises:
+        ValueError: If the sheet does not have the Gilts in Issue layout
+    """
+    with _first_sheet(excel_file, file_contents) as reader:
+        yield from _sheet_records(reader)
+
+def _sheet_records(reader):
+    """Typed records for the gilts on an open sheet (see iter_gilt_records)."""
+    rows = reader.rows()
+    as_of = section = group = None
+    columns = {}
+    for kind, _, row_values, raw_row in _classify_rows(rows):
+        if kind == 'title':
+            title_date = _title_as_of(' '.join(row_values))
+            as_of = datetime.strptime(title_date, '%d/%m/%Y').date() if title_date else None
+        elif kind == 'header':
+            columns = _record_columns(row_values)
+            # The first heading names the first section (e.g. Conventional Gilts)
+            section = row_values[0] or None
+        elif kind == 'section':
+            section, group = row_values[0], None
+        elif kind == 'group':
+            group = row_values[0]
+        elif kind == 'data':
+            def cell(field):
+                return raw_row[columns[field]] if field in columns else None
+            
+            def text(field):
+                return (row_values[columns[field]] or None) if field in columns else None
+            
+            yield GiltRecord(
+                as_of=as_of,
+                section=section,
+                group=group,
+                name=row_values[0],
+                isin=text('isin'),
+                coupon=_coupon(row_values[0]),
+                redemption_date=_excel_date(cell('redemption_date'), reader.datemode),
+                first_issue_date=_excel_date(cell('first_issue_date'), reader.datemode),
+                dividend_dates=text('dividend_dates'),
+                ex_dividend_date=_excel_date(cell('ex_dividend_date'), reader.datemode),
+                amount_in_issue=_decimal(cell('amount_in_issue')),
+                amount_including_uplift=_decimal(cell('amount_including_uplift'))
+            )
+
+def export_typed_csv(excel_file=None, output_dir=None, file_contents=None, date_str=None):
+    """
+    Write the gilts in a workbook to gilts_in_issue_typed_YYYYMMDD.csv, one typed record per row.
+    
+    Unlike format_gilts_csv, which keeps the sheet's layout and cell text, this
+    has one header row of GiltRecord.FIELDS, ISO dates and plain decimal amounts.
+    
+    Args:
+        excel_file (str, optional): Path to the Excel file.
+        output_dir (str, optional): Directory for the CSV file. Defaults to 'csv_exports'.
+        file_contents (bytes, optional): Contents of the Excel file, instead of excel_file.
+        date_str (str, optional): Date of the data in format 'DD/MM/YYYY', used to name the file.
+    
+    Returns:
+        str: Path to the CSV file, or None if conversion failed
+    """
+    csv_path = _csv_path(output_dir or _default_csv_dir(), excel_file, date_str, prefix='gilts_in_issue_typed')
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    temp_path = f"{csv_path}.{os.getpid()}.part"
+    try:
+        with open(temp_path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(GiltRecord.FIELDS)
+            count = 0
+            for record in iter_gilt_records(excel_file, file_contents):
+                writer.writerow(record.as_row())
+                count += 1
+        os.replace(temp_path, csv_path)
+    except Exception as e:
+        print(f"Error writing typed CSV: {e}")
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    print(f"Wrote {count} typed records to: {csv_path}")
+    return csv_path
+
+def _convert_one(excel_file, output_dir, typed):
+    """
+    Convert one workbook in a batch worker, capturing its log instead of printing it.
+    
+    Returns:
+        dict: file, csv, typed_csv (or None), seconds and error (None on success)
+    """
+    log = io.StringIO()
+    started = time.monotonic()
+    result = {'file': excel_file, 'csv': None, 'typed_csv': None, 'error': None}
+    try:
+        with redirect_stdout(log), redirect_stderr(log):
+            result['csv'] = format_gilts_csv(excel_file, output_dir)
+            if result['csv'] and typed:
+                result['typed_csv'] = export_typed_csv(excel_file, output_dir)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    if result['error'] is None and (result['csv'] is None or (typed and result['typed_csv'] is None)):
+        # The converters report their own errors on stdout; keep the last line
+        lines = [line for line in log.getvalue().splitlines() if line.strip()]
+        result['error'] = lines[-1].strip() if lines else "conversion failed"
+    result['seconds'] = time.monotonic() - started
+    return result
+
+def _link_outputs(store, digest, excel_files, output_dir, typed=False):
+    """
+    Give workbooks the CSVs already converted from the same contents.
+    
+    Args:
+        store (RawStore): Store whose index records the conversions.
+        digest (str): SHA-256 shared by the workbooks.
+        excel_files (list): Workbooks to link CSVs for, named by their dates.
+        output_dir (str): Directory for the CSV files.
+        typed (bool): Link the typed CSVs as well.
+    
+    Returns:
+        bool: False, with nothing linked, if the contents have no current CSV
+        (or typed CSV when typed is set)
+    """
+    csv_path = store.converted_csv(digest)
+    typed_csv = store.converted_csv(digest, typed=True) if typed else None
+    if not csv_path or (typed and not typed_csv):
+        return False
+    for excel_file in excel_files:
+        _link_or_copy(csv_path, _csv_path(output_dir, excel_file))
+        if typed:
+            _link_or_copy(typed_csv, _csv_path(output_dir, excel_file, prefix='gilts_in_issue_typed'))
+    return True
+
+def _batch_files(source):
+    """Workbooks to convert: a directory's gilts_in_issue_*.xls* files, or the files matching a glob."""
+    if os.path.isdir(source):
+        source = os.path.join(source, 'gilts_in_issue_*.xls*')
+    # Skip partial downloads left behind by an interrupted run
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path) and not path.endswith('.part'))
+
+def convert_batch(source=None, output_dir=None, workers=None, typed=False, force=False):
+    """
+    Convert many workbooks to CSV in parallel worker processes.
+    
+    Workbooks are keyed by their SHA-256, taken from the raw store index for
+    archived downloads and hashed in the workers otherwise. Contents that the
+    raw store records as converted by this CONVERTER_VERSION are not converted
+    again: their CSVs are hard-linked under each file's date, as in
+    convert_deduplicated. The remaining distinct workbooks are converted by
+    format_gilts_csv in a ProcessPoolExecutor, once per SHA-256, and each
+    conversion is recorded in the store as soon as it completes, so an
+    interrupted batch keeps its progress. Every CSV is written to a temporary
+    file and moved into place, so no half-written CSVs are left behind.
+    
+    Args:
+        source (str, optional): Directory (its gilts_in_issue_*.xls* files are converted)
+            or glob pattern. Defaults to the downloads directory.
+        output_dir (str, optional): Directory for the CSV files. Defaults to 'csv_exports'.
+        workers (int, optional): Worker processes. Defaults to the number of CPUs.
+        typed (bool): Also write the typed CSV for each file (see export_typed_csv).
+        force (bool): Convert every distinct workbook, even if it was converted before.
+    
+    Returns:
+        dict: 'converted' (list of result dicts), 'failed' (list of result dicts with
+        an 'error'), 'skipped' (files given the CSVs of identical contents instead of
+        being converted), 'seconds' (wall-clock time) and 'file_seconds' (p50, p90 and
+        max seconds per file)
+    """
+    all_files = _batch_files(source or _downloads_dir())
+    output_dir = output_dir or _default_csv_dir()
+    os.makedirs(output_dir, exist_ok=True)
+    store = _shared_raw_store()
+    
+    started = time.monotonic()
+    results = []
+    skipped = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        digests = {path: store.digest_for(path) for path in all_files}
+        unknown = [path for path, digest in digests.items() if digest is None]
+        digests.update(zip(unknown, executor.map(_file_digest, unknown, chunksize=16)))
+        
+        # Identical workbooks (weekend and holiday snapshots) are converted once
+        by_digest = {}
+        for path in all_files:
+            by_digest.setdefault(digests[path], []).append(path)
+        pending = {}  # Workbook to convert -> its digest
+        for digest, paths in by_digest.items():
+            if not force and _link_outputs(store, digest, paths, output_dir, typed):
+                skipped += paths
+            else:
+                pending[paths[0]] = digest
+        print(f"Converting {len(pending)} workbooks with {workers or os.cpu_count()} workers"
+              + (f", {len(skipped)} already converted" if skipped else "") + "...")
+        
+        futures = {executor.submit(_convert_one, path, output_dir, typed): path for path in pending}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died
+                result = {'file': futures[future], 'csv': None, 'typed_csv': None,
+                          'error': f"{type(e).__name__}: {e}", 'seconds': None}
+            results.append(result)
+            digest = pending[result['file']]
+            duplicates = by_digest[digest][1:]
+            if not result['error']:
+                store.record_conversion(digest, result['csv'], result['typed_csv'])
+                _link_outputs(store, digest, duplicates, output_dir, typed)
+                skipped += duplicates
+            else:
+                results += [{'file': path, 'csv': None, 'typed_csv': None, 'seconds': None,
+                             'error': f"same contents as {os.path.basename(result['file'])}: {result['error']}"}
+                            for path in duplicates]
+    
+    durations = [result['seconds'] for result in results if result['seconds'] is not None]
+    summary = {
+        'converted': sorted((r for r in results if not r['error']), key=lambda r: r['file']),
+        'failed': sorted((r for r in results if r['error']), key=lambda r: r['file']),
+        'skipped': sorted(skipped),
+        'seconds': time.monotonic() - started,
+        'file_seconds': {'p50': _percentile(durations, 50), 'p90': _percentile(durations, 90),
+                         'max': max(durations) if durations else None}
+    }
+    print(f"Converted {len(summary['converted'])} of {len(pending)} workbooks in {summary['seconds']:.1f}s")
+    if durations:
+        print(f"Per file: p50 {summary['file_seconds']['p50']:.3f}s, p90 {summary['file_seconds']['p90']:.3f}s, "
+              f"max {summary['file_seconds']['max']:.3f}s")
+    for result in summary['failed']:
+        print(f"Failed: {result['file']}: {result['error']}")
+    return summary
+
+def convert_deduplicated(excel_file=None, file_contents=None, date_str=None, output_dir=None):
+    """
+    Convert a workbook to CSV unless the same bytes have already been converted.
+    
+    The workbook's SHA-256 is looked up in the raw store. If an earlier snapshot
+    with identical contents already has a CSV, the CSV for this date is made a
+    hard link to it instead of running the conversion again.
+    
+    Args:
+        excel_file (str, optional): Path to the Excel file.
+        file_contents (bytes, optional): Contents of the Excel file, instead of excel_file.
+        date_str (str, optional): Date of the data in format 'DD/MM/YYYY'.
+        output_dir (str, optional): Directory for the CSV file. Defaults to 'csv_exports'.
+    
+    Returns:
+        str: Path to the CSV file, or None if conversion failed
+    """
+    store = _shared_raw_store()
+    if file_contents is not None:
+        digest = _content_digest(file_contents)
+    else:
+        digest = store.digest_for(excel_file) or _file_digest(excel_file)
+    
+    existing_csv = store.converted_csv(digest)
+    if existing_csv:
+        csv_path = _csv_path(output_dir or _default_csv_dir(), excel_file, date_str)
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        _link_or_copy(existing_csv, csv_path)
+        print(f"Workbook unchanged since {os.path.basename(existing_csv)}, skipped conversion: {csv_path}")
+        return csv_path
+    
+    csv_path = format_gilts_csv(excel_file, output_dir, file_contents=file_contents, date_str=date_str)
+    if csv_path:
+        store.record_conversion(digest, csv_path)
+    return csv_path
+
+def _workbook_title(data):
+    """Text of the title row (row 1) of the first sheet of an Excel file held in memory."""
+    with _first_sheet(file_contents=data) as reader:
+        title = next(reader.rows(), None)
+        if title is None:
+            return ''
+        return ' '.join(str(value).strip() for value in title if str(value).strip())
+
+def _title_as_of(title):
+    """
+    Find the as-of date in a report title such as 'Gilts in Issue as at 17 March 2025'.
+    
+    Returns:
+        str: The date in format 'DD/MM/YYYY', or None if no date was recognised
+    """
+    for pattern, date_format in TITLE_DATE_FORMATS:
+        match = re.search(pattern, title)
+        if match:
+            try:
+                return datetime.strptime(match.group(0), date_format).strftime('%d/%m/%Y')
+            except ValueError:
+                continue
+    return None
+
+def _seconds_until(clock_time, now):
+    """Seconds from now until the next occurrence of a time of day."""
+    target = now.replace(hour=clock_time.hour, minute=clock_time.minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+async def watch_publications(poll_interval=60, idle_interval=900, window_start=dt_time(7, 0),
+                             window_end=dt_time(11, 0), pool=None, on_publish=None, max_polls=None,
+                             **fetch_options):
+    """
+    Poll the report and convert each new snapshot as soon as DMO publishes it.
+    
+    A warm browser pool is kept open between polls. Each poll exports the date
+    the report page shows by default, which is the latest publication, and
+    compares a SHA-256 hash of the bytes, then the title row, with the previous
+    snapshot. Only a new as-of date triggers conversion. HTTP replay is not
+    used: a recorded request asks for one fixed date, and guessing the next
+    date (e.g. today's) would ask for data that may not be published yet.
+    
+    Args:
+        poll_interval (float): Seconds between polls inside the publication window.
+        idle_interval (float): Longest sleep in seconds between polls outside the window.
+        window_start (datetime.time): Start of the expected publication window (local time).
+        window_end (datetime.time): End of the expected publication window (local time).
+        pool (BrowserPool, optional): Pool to poll with. If None, one is created and kept warm.
+        on_publish (callable, optional): Called with (csv_path, as_of_date) for every new snapshot.
+        max_polls (int, optional): Stop after this many polls. None polls until cancelled.
+        **fetch_options: Passed on to fetch_reports (base_url, time_budget, debug, ...).
+            fast defaults to True. replay is ignored.
+    
+    An error during a poll (an unreadable workbook, a failed save or an error in
+    on_publish) is logged and the watcher carries on with the next poll.
+    """
+    fetch_options.setdefault('fast', True)
+    if fetch_options.pop('replay', False):
+        print("The watcher always uses the browser; replay is ignored")
+    fetch_options['page_date'] = True
+    own_pool = pool is None
+    if own_pool:
+        # Keep the context open across the longest gap between polls
+        pool = BrowserPool(size=1, idle_timeout=max(idle_interval, poll_interval) * 2)
+    
+    last_hash = None
+    last_title = None
+    polls = 0
+    print(f"Watching for new Gilts in Issue data between {window_start:%H:%M} and {window_end:%H:%M}")
+    
+    try:
+        await pool.start()
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            try:
+                data = await fetch_gilts_workbook(pool=pool, **fetch_options)
+                
+                if data and _is_workbook(data):
+                    digest = _content_digest(data)
+                    if digest != last_hash:
+                        title = _workbook_title(data)
+                        if title != last_title:
+                            as_of = _title_as_of(title) or datetime.now().strftime('%d/%m/%Y')
+                            print(f"New publication detected: {title}")
+                            
+                            _archive_download(data, _output_path(_downloads_dir(), as_of, data=data))
+                            csv_path = await asyncio.to_thread(convert_deduplicated, file_contents=data,
+                                                               date_str=as_of)
+                            if csv_path and on_publish:
+                                on_publish(csv_path, as_of)
+                            last_title = title
+                        else:
+                            print("Workbook changed but the as-of date is the same, nothing to do")
+                        # Only remember the workbook once it has been handled, so a
+                        # failed poll is retried
+                        last_hash = digest
+                    else:
+                        print("No new publication yet")
+                else:
+                    print("Poll did not return an Excel workbook")
+            except Exception as e:
+                # Keep watching; the next poll may well succeed
+                print(f"Error during poll {polls}: {e}")
+                traceback.print_exc()
+            
+            # Poll often inside the window, otherwise sleep until it opens
+            now = datetime.now()
+            if window_start <= now.time() <= window_end:
+                delay = poll_interval
+            else:
+                delay = min(idle_interval, _seconds_until(window_start, now))
+            if max_polls is None or polls < max_polls:
+                print(f"Next poll in {delay:.0f} seconds")
+                await asyncio.sleep(delay)
+    finally:
+        if own_pool:
+            await pool.close()
+
+def _check_and_convert(excel_file, typed=False):
+    """
+    Check that a downloaded file is a real Excel workbook and convert it to CSV.
+    
+    Args:
+        excel_file (str): Path to the downloaded file.
+        typed (bool): Also write the typed CSV (see export_typed_csv).
+    
+    Returns:
+        str: Path to the CSV file, or None if the file was not usable
+    """
+    # Verify if we got a real Excel file
+    file_type = os.popen(f"file '{excel_file}'").read().strip()
+    print(f"File type: {file_type}")
+    
+    if "HTML" in file_type or "html" in file_type:
+        print("Warning: Downloaded file appears to be HTML, not Excel.")
+        print("Bot protection may still be active.")
+        return None
+    elif any(ft in file_type for ft in ["Excel", "Microsoft", "Zip archive", "Composite Document File"]):
+        print("Success! Downloaded a valid Excel file.")
+    
+    # Step 2: Format the Excel file to CSV
+    print("\n=== STEP 2: FORMATTING TO CSV ===\n")
+    csv_path = convert_deduplicated(excel_file)
+    if csv_path and typed:
+        export_typed_csv(excel_file)
+    return csv_path
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Download Gilts in Issue data from the DMO website and convert it to CSV."
+    )
+    parser.add_argument('--date', help="Date to download in DD/MM/YYYY format (default: yesterday)")
+    parser.add_argument('--start-date', help="Backfill every date from this one (DD/MM/YYYY)")
+    parser.add_argument('--end-date', help="Last date of the backfill (DD/MM/YYYY, default: yesterday)")
+    parser.add_argument('--concurrency', type=int, default=3,
+                        help="Most dates fetched at the same time during a backfill; fewer are used while "
+                             "DMO is slow or serving challenge pages (default: 3)")
+    parser.add_argument('--include-weekends', action='store_true',
+                        help="Also fetch Saturdays and Sundays during a backfill")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="Retries per date, with exponential backoff, during a backfill (default: 3)")
+    parser.add_argument('--slow-response', type=float, default=20.0,
+                        help="Seconds an Excel export may take during a backfill before fewer dates are "
+                             "fetched at once (default: 20)")
+    parser.add_argument('--cooldown', type=float, default=30.0,
+                        help="Seconds to pause a backfill after DMO serves a challenge page (default: 30)")
+    parser.add_argument('--journal', default=JOURNAL_FILE,
+                        help="Backfill journal; dates it records as done are skipped when a backfill "
+                             "is re-run (default: .gilts_cache/backfill_journal.jsonl)")
+    parser.add_argument('--replay', action='store_true',
+                        help="Replay the recorded Excel export request over plain HTTP when possible")
+    parser.add_argument('--fast', action='store_true',
+                        help="Skip human-like pauses and continue as soon as each page or download event fires")
+    parser.add_argument('--time-budget', type=float,
+                        help="Overall time limit in seconds for each browser download")
+    parser.add_argument('--engine', choices=BROWSER_ENGINES, default='chromium',
+                        help="Browser engine to launch (default: chromium)")
+    parser.add_argument('--headless', action='store_true', help="Run the browser without a window")
+    parser.add_argument('--benchmark', metavar='ENGINES', nargs='?', const=','.join(BROWSER_ENGINES),
+                        help="Time cold and warm downloads for comma-separated engines "
+                             "(default: all) against --base-url, then exit")
+    parser.add_argument('--cycles', type=int, default=5,
+                        help="Cold and warm download cycles per engine for --benchmark (default: 5)")
+    parser.add_argument('--cdp-endpoint', default=os.environ.get('GILTS_CDP_ENDPOINT'),
+                        help="Attach to a running Chromium at this CDP endpoint (e.g. http://127.0.0.1:9222) "
+                             "instead of launching one (default: $GILTS_CDP_ENDPOINT)")
+    parser.add_argument('--block-resources', action='store_true',
+                        help="Abort images, fonts and other non-essential or third-party requests")
+    parser.add_argument('--allow-domain', action='append', default=[],
+                        help="Extra domain allowed to load when blocking resources (repeatable)")
+    parser.add_argument('--measure-blocking', action='store_true',
+                        help="Load the report page with and without resource blocking and report the savings")
+    parser.add_argument('--debug', action='store_true',
+                        help="Print every input and button found on the report page")
+    parser.add_argument('--typed', action='store_true',
+                        help="Also write gilts_in_issue_typed_<date>.csv with ISO dates and decimal amounts")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="Convert the download straight from memory, archiving the Excel file in the background")
+    parser.add_argument('--no-archive', action='store_true',
+                        help="With --in-memory, do not keep the raw Excel file")
+    parser.add_argument('--convert-all', metavar='DIR_OR_GLOB', nargs='?', const='',
+                        help="Convert every workbook in a directory (default: downloads) or matching a glob, "
+                             "in parallel, then exit")
+    parser.add_argument('--workers', type=int,
+                        help="Worker processes for --convert-all (default: number of CPUs)")
+    parser.add_argument('--force', action='store_true',
+                        help="With --convert-all, also convert workbooks that were converted before")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and convert each new snapshot as soon as it is published")
+    parser.add_argument('--poll-interval', type=float, default=60,
+                        help="Seconds between polls inside the publication window (default: 60)")
+    parser.add_argument('--idle-interval', type=float, default=900,
+                        help="Longest wait in seconds between polls outside the window (default: 900)")
+    parser.add_argument('--window-start', default='07:00',
+                        help="Start of the expected publication window, HH:MM (default: 07:00)")
+    parser.add_argument('--window-end', default='11:00',
+                        help="End of the expected publication window, HH:MM (default: 11:00)")
+    parser.add_argument('--reports',
+                        help="Comma-separated DMO report codes to download together, e.g. D1A,D5D")
+    parser.add_argument('--base-url', default=DMO_REPORT_URL,
+                        help="Report page URL without the query string, e.g. a local dmo_standin_server.py")
+    return parser.parse_args(argv)
+
+def _pool_from_args(args, size=1, idle_timeout=300):
+    """Create the browser pool described by the command line options."""
+    blocking_profile = None
+    if args.block_resources:
+        blocking_profile = ResourceBlockingProfile(allowed_domains=_allowed_domains(args))
+    return BrowserPool(size=size, idle_timeout=idle_timeout, blocking_profile=blocking_profile,
+                       cdp_endpoint=args.cdp_endpoint, engine=args.engine, headless=args.headless)
+
+def _allowed_domains(args):
+    """Domains allowed through resource blocking: the defaults, --allow-domain and the report host."""
+    report_host = urlparse(args.base_url).hostname
+    return ALLOWED_DOMAINS + tuple(args.allow_domain) + ((report_host,) if report_host else ())
+
+def _fetch_options(args):
+    """Keyword arguments for fetch_gilts_workbook taken from the command line options."""
+    return {
+        'replay': args.replay,
+        'fast': args.fast,
+        'time_budget': args.time_budget,
+        'debug': args.debug,
+        'base_url': args.base_url
+    }
+
+async def run_in_memory(args, date_str):
+    """Download and format one date, passing the Excel file to the converter in memory."""
+    print("\n=== DOWNLOADING AND FORMATTING GILTS DATA IN MEMORY ===\n")
+    async with _pool_from_args(args) as pool:
+        csv_path = await download_and_convert(date_str, pool=pool, archive=not args.no_archive,
+                                              typed=args.typed, **_fetch_options(args))
+    
+    if csv_path:
+        print("\nComplete process successful!")
+        print(f"Formatted CSV file: {csv_path}")
+    else:
+        print("\nDownload or CSV formatting failed.")
+
+async def run_reports(args):
+    """Download several reports in one browser session, converting Gilts in Issue to CSV."""
+    report_codes = [code.strip() for code in args.reports.split(',') if code.strip()]
+    
+    print("\n=== STEP 1: DOWNLOADING DMO REPORTS ===\n")
+    async with _pool_from_args(args) as pool:
+        paths = await download_reports(report_codes, args.date, pool=pool, **_fetch_options(args))
+    
+    for report_code, excel_file in paths.items():
+        if not excel_file:
+            print(f"{report_code}: download failed")
+        elif report_code == GILTS_REPORT_CODE:
+            # Only the Gilts in Issue layout is understood by the CSV converter
+            csv_path = _check_and_convert(excel_file, typed=args.typed)
+            print(f"{report_code}: {excel_file} -> {csv_path}")
+        else:
+            print(f"{report_code}: {excel_file}")
+
+async def run_backfill(args):
+    """Download and format every date in the range given on the command line."""
+    yesterday_str = (datetime.now() - timedelta(days=1)).strftime('%d/%m/%Y')
+    end_date = args.end_date or yesterday_str
+    
+    journal = BackfillJournal(args.journal)
+    
+    print("\n=== STEP 1: BACKFILLING GILTS DATA ===\n")
+    async with _pool_from_args(args, size=args.concurrency) as pool:
+        results = await backfill_gilts_data(
+            args.start_date, end_date,
+            concurrency=args.concurrency,
+            pool=pool,
+            skip_weekends=not args.include_weekends,
+            replay=args.replay,
+            fast=args.fast,
+            time_budget=args.time_budget,
+            journal=journal,
+            retries=args.retries,
+            slow_response=args.slow_response,
+            cooldown=args.cooldown
+        )
+    
+    converted = 0
+    for date_str, excel_file in results.items():
+        if journal.state(GILTS_REPORT_CODE, date_str) == BackfillJournal.CONVERTED:
+            converted += 1
+            continue
+        if not (excel_file and os.path.exists(excel_file)):
+            continue
+        csv_path = _check_and_convert(excel_file, typed=args.typed)
+        if csv_path:
+            journal.record(GILTS_REPORT_CODE, date_str, BackfillJournal.CONVERTED, file=excel_file, csv=csv_path)
+            converted += 1
+        else:
+            journal.record(GILTS_REPORT_CODE, date_str, BackfillJournal.FAILED, file=excel_file,
+                           reason="conversion to CSV failed")
+    print(f"\nConverted {converted} of {len(results)} dates to CSV.")
+
+async def main(args=None):
     """Main function to download and format Gilts data."""
+    if args is None:
+        args = parse_args([])
+    
+    if args.measure_blocking:
+        await measure_resource_blocking(
+            ResourceBlockingProfile(allowed_domains=_allowed_domains(args)),
+            url=_report_url(GILTS_REPORT_CODE, args.base_url)
+        )
+        return
+    
+    if args.convert_all is not None:
+        summary = convert_batch(args.convert_all or None, workers=args.workers, typed=args.typed,
+                                force=args.force)
+        if summary['failed']:
+            sys.exit(1)
+        return
+    
+    if args.benchmark:
+        await benchmark_engines(
+            [engine.strip() for engine in args.benchmark.split(',') if engine.strip()],
+            cycles=args.cycles,
+            base_url=args.base_url,
+            headless=args.headless,
+            date_str=args.date
+        )
+        return
+    
+    if args.start_date:
+        await run_backfill(args)
+        return
+    
+    if args.reports:
+        await run_reports(args)
+        return
+    
+    if args.watch:
+        # Keep the context open across the longest gap between polls
+        idle_timeout = max(args.idle_interval, args.poll_interval) * 2
+        async with _pool_from_args(args, idle_timeout=idle_timeout) as pool:
+            fetch_options = _fetch_options(args)
+            fetch_options.update(replay=False, fast=True)
+            await watch_publications(
+                poll_interval=args.poll_interval,
+                idle_interval=args.idle_interval,
+                window_start=datetime.strptime(args.window_start, '%H:%M').time(),
+                window_end=datetime.strptime(args.window_end, '%H:%M').time(),
+                pool=pool,
+                **fetch_options
+            )
+        return
+    
     # Calculate yesterday's date
     yesterday = datetime.now() - timedelta(days=1)
-    yesterday_str = yesterday.strftime('%d/%m/%Y')
+    yesterday_str = args.date or yesterday.strftime('%d/%m/%Y')
+    
+    if args.in_memory:
+        await run_in_memory(args, yesterday_str)
+        return
     
     try:
         # Step 1: Download the Excel file
         print("\n=== STEP 1: DOWNLOADING GILTS DATA ===\n")
-        excel_file = await download_gilts_data(yesterday_str)
+        async with _pool_from_args(args) as pool:
+            excel_file = await download_gilts_data(yesterday_str, pool=pool, **_fetch_options(args))
         
         if excel_file and os.path.exists(excel_file):
-            # Verify if we got a real Excel file
-            file_type = os.popen(f"file '{excel_file}'").read().strip()
-            print(f"File type: {file_type}")
-            
-            if "HTML" in file_type or "html" in file_type:
-                print("Warning: Downloaded file appears to be HTML, not Excel.")
-                print("Bot protection may still be active.")
-                return
-            elif any(ft in file_type for ft in ["Excel", "Microsoft", "Zip archive", "Composite Document File"]):
-                print("Success! Downloaded a valid Excel file.")
-            
-            # Step 2: Format the Excel file to CSV
-            print("\n=== STEP 2: FORMATTING TO CSV ===\n")
-            csv_path = format_gilts_csv(excel_file)
+            csv_path = _check_and_convert(excel_file, typed=args.typed)
             
             if csv_path:
-                print(f"\nComplete process successful!")
+                print("\nComplete process successful!")
                 print(f"Downloaded Excel file: {excel_file}")
                 print(f"Formatted CSV file: {csv_path}")
             else:
                 print("\nCSV formatting failed.")
         else:
             print("\nDownload failed. Please try manual download:")
-            print(f"1. Visit: https://www.dmo.gov.uk/data/pdfdatareport?reportCode=D1A")
+            print(f"1. Visit: {GILTS_REPORT_URL}")
             print(f"2. Enter date: {yesterday_str}")
             print("3. Click 'Excel' button")
     except Exception as e:
@@ -395,4 +3005,4 @@ async def main():
 
 if __name__ == "__main__":
     # Run the main async function
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# The converter is a single script at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import download_and_format_gilts as gilts
+
+
+@pytest.fixture
+def raw_store(tmp_path, monkeypatch):
+    """A RawStore in tmp_path used in place of downloads/raw."""
+    store = gilts.RawStore(str(tmp_path / 'raw'))
+    monkeypatch.setattr(gilts, '_raw_store', store)
+    return store
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Point .gilts_cache (recorded export requests and the like) at tmp_path."""
+    path = tmp_path / 'cache'
+    path.mkdir()
+    monkeypatch.setattr(gilts, 'CACHE_DIR', str(path))
+    return path
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import shutil
+
+import download_and_format_gilts as gilts
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+
+class FakeDownloads:
+    """Stands in for download_gilts_data, answering each date from a script of outcomes."""
+    
+    def __init__(self, tmp_path, outcomes=None):
+        self.tmp_path = tmp_path
+        self.outcomes = outcomes or {}
+        self.calls = []
+    
+    async def __call__(self, date_str, pool=None, **fetch_options):
+        self.calls.append(date_str)
+        await asyncio.sleep(0)
+        script = self.outcomes.get(date_str, [])
+        outcome = script.pop(0) if script else 'workbook'
+        path = str(self.tmp_path / f"gilts_in_issue_{date_str.replace('/', '-')}.xls")
+        if outcome == 'workbook':
+            shutil.copyfile(os.path.join(FIXTURES_DIR, 'gilts_in_issue_small.xls'), path)
+            return path
+        if outcome == 'html':
+            with open(path, 'w') as f:
+                f.write('<html>Just a moment...</html>')
+            return path
+        if outcome == 'slow failure':
+            await asyncio.sleep(0.05)
+            return None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return None
+
+
+def _backfill(journal, **options):
+    options.setdefault('backoff', 0.01)
+    return asyncio.run(gilts.backfill_gilts_data('17/03/2025', '19/03/2025', pool=object(),
+                                                 journal=journal, **options))
+
+
+def _states(journal_path):
+    journal = gilts.BackfillJournal(str(journal_path))
+    return {date: entry['state'] for (_, date), entry in journal.jobs.items()}
+
+
+def test_failed_attempts_are_retried_and_journalled(tmp_path, monkeypatch):
+    fake = FakeDownloads(tmp_path, {'18/03/2025': [None, RuntimeError("page crashed")]})
+    monkeypatch.setattr(gilts, 'download_gilts_data', fake)
+    journal_path = tmp_path / 'journal.jsonl'
+    
+    results = _backfill(gilts.BackfillJournal(str(journal_path)))
+    
+    assert all(results.values())
+    assert fake.calls.count('18/03/2025') == 3
+    with open(journal_path) as f:
+        lines = [line for line in f if '18/03/2025' in line]
+    assert ['pending', 'failed', 'failed', 'downloaded'] == [
+        json.loads(line)['state'] for line in lines]
+    assert 'RuntimeError: page crashed' in lines[2]
+
+
+def test_challenge_page_is_a_failed_attempt(tmp_path, monkeypatch):
+    fake = FakeDownloads(tmp_path, {'17/03/2025': ['html', 'html', 'html']})
+    monkeypatch.setattr(gilts, 'download_gilts_data', fake)
+    journal = gilts.BackfillJournal(str(tmp_path / 'journal.jsonl'))
+    
+    results = _backfill(journal, retries=2)
+    
+    assert results['17/03/2025'] is None
+    assert journal.jobs[('D1A', '17/03/2025')]['reason'] == 'challenge page'
+    assert not os.path.exists(tmp_path / 'gilts_in_issue_17-03-2025.xls')
+
+
+def test_rerun_resumes_only_unfinished_dates(tmp_path, monkeypatch):
+    journal_path = tmp_path / 'journal.jsonl'
+    first = FakeDownloads(tmp_path, {'19/03/2025': [None, None]})
+    monkeypatch.setattr(gilts, 'download_gilts_data', first)
+    _backfill(gilts.BackfillJournal(str(journal_path)), retries=1)
+    assert _states(journal_path) == {'17/03/2025': 'downloaded', '18/03/2025': 'downloaded',
+                                     '19/03/2025': 'failed'}
+    
+    second = FakeDownloads(tmp_path)
+    monkeypatch.setattr(gilts, 'download_gilts_data', second)
+    results = _backfill(gilts.BackfillJournal(str(journal_path)))
+    
+    assert second.calls == ['19/03/2025']
+    assert all(results.values())
+
+
+def test_backing_off_date_does_not_hold_a_slot(tmp_path, monkeypatch):
+    fake = FakeDownloads(tmp_path, {'17/03/2025': ['slow failure']})
+    monkeypatch.setattr(gilts, 'download_gilts_data', fake)
+    
+    _backfill(gilts.BackfillJournal(path=None), concurrency=1, backoff=0.5)
+    
+    # The other dates run while 17/03 waits for its retry
+    assert fake.calls == ['17/03/2025', '18/03/2025', '19/03/2025', '17/03/2025']
+
+
+def test_record_many_appends_one_line_per_job(tmp_path):
+    journal_path = tmp_path / 'journal.jsonl'
+    journal = gilts.BackfillJournal(str(journal_path))
+    
+    journal.record_many('D1A', ['17/03/2025', '18/03/2025'], gilts.BackfillJournal.PENDING)
+    journal.record_many('D1A', [], gilts.BackfillJournal.PENDING)
+    
+    with open(journal_path) as f:
+        assert len(f.readlines()) == 2
+    assert _states(journal_path) == {'17/03/2025': 'pending', '18/03/2025': 'pending'}
@@ -0,0 +1,60 @@
+import os
+import shutil
+
+import download_and_format_gilts as gilts
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+
+def _copy_fixture(target_dir, name, fixture='gilts_in_issue_small.xls'):
+    path = os.path.join(target_dir, name)
+    shutil.copyfile(os.path.join(FIXTURES_DIR, fixture), path)
+    return path
+
+
+def test_identical_workbooks_are_converted_once(tmp_path, raw_store):
+    source = tmp_path / 'in'
+    source.mkdir()
+    friday = _copy_fixture(str(source), 'gilts_in_issue_14-03-2025.xls')
+    # A weekend alias of the same snapshot
+    os.link(friday, str(source / 'gilts_in_issue_15-03-2025.xls'))
+    _copy_fixture(str(source), 'gilts_in_issue_17-03-2025.xls', 'gilts_in_issue_large.xls')
+    output_dir = str(tmp_path / 'out')
+    
+    summary = gilts.convert_batch(str(source), output_dir, workers=2)
+    
+    assert len(summary['converted']) == 2
+    assert [os.path.basename(path) for path in summary['skipped']] == ['gilts_in_issue_15-03-2025.xls']
+    assert os.path.samefile(os.path.join(output_dir, 'gilts_in_issue_20250314.csv'),
+                            os.path.join(output_dir, 'gilts_in_issue_20250315.csv'))
+
+
+def test_second_batch_converts_only_new_contents(tmp_path, raw_store):
+    source = tmp_path / 'in'
+    source.mkdir()
+    _copy_fixture(str(source), 'gilts_in_issue_14-03-2025.xls')
+    output_dir = str(tmp_path / 'out')
+    gilts.convert_batch(str(source), output_dir, workers=1)
+    
+    # Same bytes under a new date, plus a genuinely new workbook
+    _copy_fixture(str(source), 'gilts_in_issue_17-03-2025.xls')
+    _copy_fixture(str(source), 'gilts_in_issue_18-03-2025.xls', 'gilts_in_issue_large.xls')
+    summary = gilts.convert_batch(str(source), output_dir, workers=1)
+    
+    assert [os.path.basename(r['file']) for r in summary['converted']] == ['gilts_in_issue_18-03-2025.xls']
+    assert len(summary['skipped']) == 2
+    assert os.path.exists(os.path.join(output_dir, 'gilts_in_issue_20250317.csv'))
+
+
+def test_converter_version_bump_converts_again(tmp_path, raw_store, monkeypatch):
+    source = tmp_path / 'in'
+    source.mkdir()
+    _copy_fixture(str(source), 'gilts_in_issue_14-03-2025.xls')
+    output_dir = str(tmp_path / 'out')
+    gilts.convert_batch(str(source), output_dir, workers=1)
+    
+    monkeypatch.setattr(gilts, 'CONVERTER_VERSION', gilts.CONVERTER_VERSION + 1)
+    summary = gilts.convert_batch(str(source), output_dir, workers=1)
+    
+    assert len(summary['converted']) == 1
+    assert not summary['skipped']
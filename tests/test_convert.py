@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import download_and_format_gilts as gilts
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'fixtures')
+EXPECTED_DIR = os.path.join(TESTS_DIR, 'expected')
+
+
+def _read(path):
+    with open(path, newline='') as f:
+        return f.read()
+
+
+def _sheet_rows(name):
+    with gilts._first_sheet(os.path.join(FIXTURES_DIR, name)) as reader:
+        return list(reader.rows())
+
+
+def _header_index(rows):
+    return next(index for index, row in enumerate(rows) if 'ISIN Code' in row)
+
+
+@pytest.mark.parametrize('name', ['gilts_in_issue_small', 'gilts_in_issue_large'])
+def test_fixture_matches_expected_csv(name, tmp_path):
+    csv_path = gilts.format_gilts_csv(os.path.join(FIXTURES_DIR, f'{name}.xls'), str(tmp_path))
+    
+    assert csv_path is not None
+    assert _read(csv_path) == _read(os.path.join(EXPECTED_DIR, f'{name}.csv'))
+
+
+def test_classify_rows_finds_moved_header():
+    rows = _sheet_rows('gilts_in_issue_small.xls')
+    header = _header_index(rows)
+    blank = [''] * len(rows[0])
+    shifted = rows[:header] + [blank] + rows[header:]
+    
+    classified = list(gilts._classify_rows(shifted))
+    
+    assert classified[2][:2] == ('header', header + 1)
+    assert [kind for kind, *_ in classified].count('data') == \
+        [kind for kind, *_ in gilts._classify_rows(rows)].count('data')
+
+
+def test_classify_rows_short_sheet_with_header_on_total_row():
+    rows = _sheet_rows('gilts_in_issue_small.xls')
+    header = _header_index(rows)
+    data = [row for row in rows[header + 1:] if row[1]][:2]
+    short = rows[:gilts.TOTAL_ROW_INDEX] + [rows[header]] + data
+    
+    kinds = [kind for kind, *_ in gilts._classify_rows(short)]
+    
+    assert len(short) == 8
+    assert kinds == ['title', 'total', 'header', 'data', 'data']
+
+
+def test_classify_rows_without_header_raises():
+    rows = _sheet_rows('gilts_in_issue_small.xls')
+    header = _header_index(rows)
+    
+    with pytest.raises(ValueError, match="header row"):
+        list(gilts._classify_rows(rows[:header]))
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import download_and_format_gilts as gilts
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+with open(os.path.join(FIXTURES_DIR, 'gilts_in_issue_small.xls'), 'rb') as f:
+    WORKBOOK = f.read()
+CHALLENGE = b'<html>Just a moment...</html>'
+
+
+def _observe(limiter, data, elapsed=0.1):
+    asyncio.run(_release(limiter, data, elapsed))
+
+
+async def _release(limiter, data, elapsed):
+    await limiter.acquire()
+    await limiter.release(data, elapsed)
+
+
+def test_limit_grows_after_a_full_round_of_fast_workbooks():
+    limiter = gilts.AdaptiveLimiter(initial=2, maximum=3)
+    
+    _observe(limiter, WORKBOOK)
+    assert limiter.limit == 2
+    _observe(limiter, WORKBOOK)
+    assert limiter.limit == 3
+    # Never above the maximum
+    for _ in range(6):
+        _observe(limiter, WORKBOOK)
+    assert limiter.limit == 3
+
+
+def test_limit_drops_after_slow_or_failed_response():
+    limiter = gilts.AdaptiveLimiter(initial=4, slow_response=1.0)
+    
+    _observe(limiter, WORKBOOK, elapsed=2.0)
+    assert limiter.limit == 3
+    _observe(limiter, None)
+    assert limiter.limit == 2
+
+def test_slow_response_restarts_the_round():
+    limiter = gilts.AdaptiveLimiter(initial=3, slow_response=1.0)
+    
+    _observe(limiter, WORKBOOK)
+    _observe(limiter, WORKBOOK)
+    _observe(limiter, WORKBOOK, elapsed=2.0)
+    _observe(limiter, WORKBOOK)
+    
+    # Only one fast workbook since the slow one, short of a full round of two
+    assert limiter.limit == 2
+
+
+def test_limit_never_falls_below_minimum():
+    limiter = gilts.AdaptiveLimiter(initial=2, minimum=2)
+    
+    _observe(limiter, None)
+    
+    assert limiter.limit == 2
+
+
+def test_challenge_halves_limit_and_pauses_requests():
+    limiter = gilts.AdaptiveLimiter(initial=6, maximum=8, cooldown=0.2)
+    
+    _observe(limiter, CHALLENGE)
+    assert (limiter.limit, limiter.challenges) == (3, 1)
+    
+    async def wait_for_slot():
+        started = time.monotonic()
+        await limiter.acquire()
+        limiter.active -= 1
+        return time.monotonic() - started
+    assert asyncio.run(wait_for_slot()) >= 0.15
+
+
+def test_requests_wait_for_a_free_slot():
+    limiter = gilts.AdaptiveLimiter(initial=2, maximum=2)
+    running = []
+    peak = []
+    
+    async def request():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return WORKBOOK
+    
+    async def main():
+        await asyncio.gather(*(limiter.run(request) for _ in range(6)))
+    asyncio.run(main())
+    
+    assert max(peak) == 2
+    assert limiter.active == 0
+
+
+def test_run_times_only_the_export_when_timings_are_given():
+    limiter = gilts.AdaptiveLimiter(initial=2, slow_response=0.05)
+    
+    async def slow_page_fast_export(timings):
+        await asyncio.sleep(0.1)
+        timings['click_to_download'] = 0.01
+        return WORKBOOK
+    
+    timings = {}
+    asyncio.run(limiter.run(lambda: slow_page_fast_export(timings), timings))
+    assert limiter.limit == 2
+    
+    async def slow_untimed():
+        await asyncio.sleep(0.1)
+        return WORKBOOK
+    asyncio.run(limiter.run(slow_untimed))
+    assert limiter.limit == 1
+
+
+def test_failed_request_is_counted_and_reraised():
+    limiter = gilts.AdaptiveLimiter(initial=2)
+    
+    async def broken():
+        raise RuntimeError("page crashed")
+    
+    with pytest.raises(RuntimeError):
+        asyncio.run(limiter.run(broken))
+    assert (limiter.limit, limiter.active) == (1, 0)
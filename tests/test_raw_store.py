@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+import download_and_format_gilts as gilts
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+
+def _fixture_bytes(name='gilts_in_issue_small.xls'):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def test_put_stores_each_workbook_once(tmp_path, raw_store):
+    data = _fixture_bytes()
+    friday = str(tmp_path / 'gilts_in_issue_14-03-2025.xls')
+    saturday = str(tmp_path / 'gilts_in_issue_15-03-2025.xls')
+    
+    digest, is_new = raw_store.put(data, friday)
+    again, is_new_again = raw_store.put(data, saturday)
+    
+    assert (digest, is_new) == (gilts._content_digest(data), True)
+    assert (again, is_new_again) == (digest, False)
+    assert os.path.samefile(friday, saturday)
+    assert sorted(os.listdir(raw_store.root)) == [digest + '.xls', 'index.json']
+    assert raw_store.digest_for(saturday) == digest
+    # The index survives a restart
+    assert gilts.RawStore(raw_store.root).digest_for(friday) == digest
+
+
+def test_put_keeps_conversion_recorded_before_archiving(tmp_path, raw_store):
+    data = _fixture_bytes()
+    digest = gilts._content_digest(data)
+    csv_path = tmp_path / 'gilts_in_issue_20250314.csv'
+    csv_path.write_text('converted')
+    
+    raw_store.record_conversion(digest, str(csv_path))
+    raw_store.put(data, str(tmp_path / 'gilts_in_issue_14-03-2025.xls'))
+    
+    assert raw_store.converted_csv(digest) == str(csv_path)
+
+
+def test_record_conversion(tmp_path, raw_store, monkeypatch):
+    csv_path = tmp_path / 'a.csv'
+    typed_csv = tmp_path / 'a_typed.csv'
+    csv_path.write_text('csv')
+    typed_csv.write_text('typed')
+    
+    raw_store.record_conversion('abc', str(csv_path), str(typed_csv))
+    assert raw_store.converted_csv('abc') == str(csv_path)
+    assert raw_store.converted_csv('abc', typed=True) == str(typed_csv)
+    
+    # A later plain conversion keeps the typed CSV
+    raw_store.record_conversion('abc', str(csv_path))
+    assert raw_store.converted_csv('abc', typed=True) == str(typed_csv)
+    
+    # A deleted CSV is not reused
+    os.remove(typed_csv)
+    assert raw_store.converted_csv('abc', typed=True) is None
+    
+    # Nor is anything written by an earlier converter
+    monkeypatch.setattr(gilts, 'CONVERTER_VERSION', gilts.CONVERTER_VERSION + 1)
+    assert raw_store.converted_csv('abc') is None
+
+
+def test_convert_deduplicated_links_repeated_snapshot(tmp_path, raw_store, monkeypatch):
+    data = _fixture_bytes()
+    output_dir = str(tmp_path / 'out')
+    friday = gilts.convert_deduplicated(file_contents=data, date_str='14/03/2025', output_dir=output_dir)
+    
+    def no_conversion(*args, **kwargs):
+        pytest.fail("the repeated snapshot was converted again")
+    monkeypatch.setattr(gilts, 'format_gilts_csv', no_conversion)
+    saturday = gilts.convert_deduplicated(file_contents=data, date_str='15/03/2025', output_dir=output_dir)
+    
+    assert os.path.basename(saturday) == 'gilts_in_issue_20250315.csv'
+    assert os.path.samefile(friday, saturday)
+
+
+def test_convert_deduplicated_uses_archived_digest(tmp_path, raw_store, monkeypatch):
+    data = _fixture_bytes()
+    output_dir = str(tmp_path / 'out')
+    friday = str(tmp_path / 'gilts_in_issue_14-03-2025.xls')
+    saturday = str(tmp_path / 'gilts_in_issue_15-03-2025.xls')
+    gilts._archive_download(data, friday)
+    gilts._archive_download(data, saturday)
+    first = gilts.convert_deduplicated(friday, output_dir=output_dir)
+    
+    # The alias is known to the store, so the file is not even read again
+    monkeypatch.setattr(gilts, '_file_digest', lambda path: pytest.fail("alias was hashed again"))
+    second = gilts.convert_deduplicated(saturday, output_dir=output_dir)
+    
+    assert os.path.basename(second) == 'gilts_in_issue_20250315.csv'
+    assert os.path.samefile(first, second)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+import download_and_format_gilts as gilts
+from dmo_standin_server import StandinConfig, start_server
+
+# The stand-in serves fixtures/gilts_in_issue_small.xls, titled as at 17 March 2025
+RECORDED_DATE = '17/03/2025'
+
+
+@pytest.fixture
+def standin():
+    config = StandinConfig()
+    server, base_url = start_server(config)
+    yield config, base_url.replace('/data/pdfdatareport', '/data/export')
+    server.shutdown()
+
+
+@pytest.fixture
+def challenge_standin():
+    config = StandinConfig(challenge=True)
+    server, base_url = start_server(config)
+    yield config, base_url.replace('/data/pdfdatareport', '/data/export')
+    server.shutdown()
+
+
+def _record(export_url, post_data='reportCode=D1A&reportDate=17%2F03%2F2025&format=excel'):
+    return {
+        'url': export_url,
+        'method': 'POST',
+        'headers': {'content-type': 'application/x-www-form-urlencoded'},
+        'post_data': post_data,
+        'cookies': [],
+        'date': RECORDED_DATE
+    }
+
+
+def _save_record(record):
+    with open(gilts._export_request_file(gilts.GILTS_REPORT_CODE), 'w') as f:
+        json.dump(record, f)
+
+
+def test_replay_substitutes_the_requested_date(standin):
+    config, export_url = standin
+    
+    data = gilts._replay_export_request(_record(export_url), '20/03/2025')
+    
+    assert config.exports[-1]['reportDate'] == '20/03/2025'
+    assert bytes(data) == config.workbook
+    assert data.sha256 == gilts._content_digest(config.workbook)
+
+
+def test_replay_refuses_record_without_its_date(standin):
+    config, export_url = standin
+    record = _record(export_url, post_data='reportCode=D1A&format=excel')
+    
+    assert gilts._replay_export_request(record, '20/03/2025') is None
+    assert not config.exports
+    # The recorded date itself can still be fetched
+    assert bytes(gilts._replay_export_request(record, RECORDED_DATE)) == config.workbook
+
+
+def test_replay_fetch_falls_back_on_html(challenge_standin, cache_dir):
+    config, export_url = challenge_standin
+    _save_record(_record(export_url))
+    
+    assert asyncio.run(gilts._replay_fetch('20/03/2025')) is None
+    assert config.exports[-1]['reportDate'] == '20/03/2025'
+
+
+def test_replay_fetch_without_record_returns_none(cache_dir):
+    assert asyncio.run(gilts._replay_fetch('20/03/2025')) is None
+
+
+def test_replay_fetch_strict_date_checks_title(standin, cache_dir):
+    config, export_url = standin
+    _save_record(_record(export_url))
+    
+    assert asyncio.run(gilts._replay_fetch('20/03/2025', strict_date=True)) is None
+    assert asyncio.run(gilts._replay_fetch('20/03/2025')) == config.workbook
+    assert asyncio.run(gilts._replay_fetch(RECORDED_DATE, strict_date=True)) == config.workbook
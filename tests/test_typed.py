@@ -0,0 +1,64 @@
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import download_and_format_gilts as gilts
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'fixtures')
+EXPECTED_DIR = os.path.join(TESTS_DIR, 'expected')
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('0 1/8% Treasury Gilt 2025', Decimal('0.125')),
+    ('4 1/4% Treasury Gilt 2027', Decimal('4.25')),
+    ('1 3/4% Treasury Gilt 2037', Decimal('1.75')),
+    ('5% Treasury Stock 2025', Decimal('5')),
+    ('0.5% Treasury Gilt 2029', Decimal('0.5')),
+    ('Treasury Floating Rate Gilt 2025', None),
+    ('', None),
+])
+def test_coupon(name, expected):
+    assert gilts._coupon(name) == expected
+
+
+def test_decimal():
+    assert gilts._decimal(26045.0) == Decimal('26045')
+    assert str(gilts._decimal(26045.0)) == '26045'
+    assert gilts._decimal(19971.28) == Decimal('19971.28')
+    assert gilts._decimal(0.1) == Decimal('0.1')
+    assert gilts._decimal('') is None
+    assert gilts._decimal('n/a') is None
+
+
+def test_excel_date():
+    assert gilts._excel_date(45733.0, 0) == date(2025, 3, 17)
+    # 1904 date system, as used by old Mac workbooks
+    assert gilts._excel_date(44271.0, 1) == date(2025, 3, 17)
+    assert gilts._excel_date('', 0) is None
+    assert gilts._excel_date(0.0, 0) is None
+    assert gilts._excel_date('7 Jun/Dec', 0) is None
+
+
+def test_typed_csv_matches_expected(tmp_path):
+    csv_path = gilts.export_typed_csv(os.path.join(FIXTURES_DIR, 'gilts_in_issue_small.xls'), str(tmp_path))
+    
+    with open(csv_path, newline='') as f:
+        written = f.read()
+    with open(os.path.join(EXPECTED_DIR, 'gilts_in_issue_typed_small.csv'), newline='') as f:
+        assert written == f.read()
+
+
+def test_records_are_typed():
+    records = list(gilts.iter_gilt_records(os.path.join(FIXTURES_DIR, 'gilts_in_issue_small.xls')))
+    first = records[0]
+    
+    assert len(records) == 42
+    assert first.as_of == date(2025, 3, 17)
+    assert first.section == 'Conventional Gilts'
+    assert first.coupon == Decimal('0.125')
+    assert first.redemption_date == date(2025, 6, 7)
+    assert first.amount_in_issue == Decimal('26045')
+    assert first.amount_including_uplift is None
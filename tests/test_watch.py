@@ -0,0 +1,46 @@
+import asyncio
+import os
+
+import download_and_format_gilts as gilts
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+
+class IdlePool:
+    async def start(self):
+        return self
+
+
+def test_watcher_polls_page_default_and_survives_errors(tmp_path, raw_store, monkeypatch):
+    with open(os.path.join(FIXTURES_DIR, 'gilts_in_issue_small.xls'), 'rb') as f:
+        workbook = f.read()
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+    monkeypatch.setattr(gilts, '_downloads_dir', lambda: str(downloads))
+    monkeypatch.setattr(gilts, '_default_csv_dir', lambda: str(tmp_path / 'csv'))
+    
+    polls = []
+    responses = [RuntimeError("page crashed"), workbook, workbook]
+    
+    async def fake_fetch(date_str=None, pool=None, **fetch_options):
+        polls.append((date_str, fetch_options))
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    monkeypatch.setattr(gilts, 'fetch_gilts_workbook', fake_fetch)
+    
+    published = []
+    asyncio.run(gilts.watch_publications(poll_interval=0, idle_interval=0, pool=IdlePool(), max_polls=3,
+                                         on_publish=lambda csv_path, as_of: published.append(as_of),
+                                         replay=True, base_url='http://127.0.0.1/report'))
+    
+    assert len(polls) == 3
+    for date_str, fetch_options in polls:
+        assert date_str is None
+        assert fetch_options['page_date'] is True
+        assert 'replay' not in fetch_options
+        assert fetch_options['base_url'] == 'http://127.0.0.1/report'
+    # Published once, after the failed first poll, and not again for the same workbook
+    assert published == ['17/03/2025']
+    assert os.path.exists(downloads / 'gilts_in_issue_17-03-2025.xls')
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+import download_and_format_gilts as gilts
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'fixtures')
+EXPECTED_DIR = os.path.join(TESTS_DIR, 'expected')
+
+
+def _read(path):
+    with open(path, newline='') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('name', ['gilts_in_issue_small', 'gilts_in_issue_large'])
+def test_xlsx_converts_like_xls(name, tmp_path):
+    csv_path = gilts.format_gilts_csv(os.path.join(FIXTURES_DIR, f'{name}.xlsx'), str(tmp_path))
+    
+    assert _read(csv_path) == _read(os.path.join(EXPECTED_DIR, f'{name}.csv'))
+
+
+def test_xlsx_typed_csv_matches_xls(tmp_path):
+    csv_path = gilts.export_typed_csv(os.path.join(FIXTURES_DIR, 'gilts_in_issue_small.xlsx'), str(tmp_path))
+    
+    assert _read(csv_path) == _read(os.path.join(EXPECTED_DIR, 'gilts_in_issue_typed_small.csv'))
+
+
+@pytest.mark.parametrize('fixture, extension', [
+    ('gilts_in_issue_small.xls', '.xls'),
+    ('gilts_in_issue_small.xlsx', '.xlsx'),
+])
+def test_download_is_saved_with_its_format_extension(fixture, extension, tmp_path, raw_store):
+    with open(os.path.join(FIXTURES_DIR, fixture), 'rb') as f:
+        data = f.read()
+    
+    output_file = gilts._output_path(str(tmp_path), '17/03/2025', data=data)
+    gilts._archive_download(data, output_file)
+    
+    assert os.path.basename(output_file) == f'gilts_in_issue_17-03-2025{extension}'
+    assert os.path.samefile(output_file, os.path.join(raw_store.root, gilts._content_digest(data) + extension))